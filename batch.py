@@ -0,0 +1,85 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from converters import cache_parts, convert_file
+from pdf_renderer import warm_up
+
+logger = logging.getLogger(__name__)
+
+ConversionResult = namedtuple('ConversionResult', ['job', 'output_file', 'error'])
+
+
+def default_worker_count():
+    return int(os.environ.get('CONVERSION_WORKERS', os.cpu_count() or 1))
+
+
+class BatchConverter:
+    """Fans ConversionJobs out to a bounded process pool that is created once and reused"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or default_worker_count()
+        self._executor = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting conversion pool with {self.max_workers} workers")
+                # spawn: both web servers are multi-threaded, which fork does not play well with
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=warm_up)
+            return self._executor
+
+    def run(self, jobs, cache=None):
+        """Yield a ConversionResult per job in completion order; a failed job never stops the rest.
+
+        With a ConversionCache, jobs whose output is already cached are served
+        from it without touching the pool, and fresh outputs are stored in it.
+        """
+        cached = []
+        keys = {}
+        for job in jobs:
+            if cache is not None:
+                keys[job] = cache.key(job.input_file, *cache_parts(job))
+                if cache.fetch(keys[job], job.output_file):
+                    cached.append(job)
+        futures = {self.executor.submit(convert_file, job): job for job in jobs if job not in cached}
+
+        for job in cached:
+            yield ConversionResult(job, job.output_file, None)
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                output_file, error = future.result(), None
+            except Exception as e:
+                logger.error(f"Error converting {job.name}: {e}")
+                logger.error(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+                if isinstance(e, BrokenProcessPool):
+                    self.discard_executor()
+                output_file, error = None, e
+            if error is None and cache is not None:
+                cache.store(keys[job], output_file)
+            yield ConversionResult(job, output_file, error)
+
+    def discard_executor(self):
+        # A worker died mid-job; the next batch gets a fresh pool
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,74 @@
+"""Cold-start import cost of the entry points, measured with python -X importtime.
+
+Usage: python benchmarks/bench_import_time.py [--runs 5] [--top 8] [--json] [module ...]
+
+Each run imports the module in a fresh interpreter, as a new container would,
+and reads the cumulative time CPython reports for it. Prints the median over
+the runs and the slowest top-level packages of the median run; --json emits one
+machine-readable line per module so results can be tracked over time.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ['app', 'app_edit', 'streamlit_app']
+
+
+def import_profile(module):
+    """{imported package: cumulative microseconds} for one fresh import of module, plus its own total"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               cwd=ROOT, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    top_level = {}
+    pending = {}
+    total = None
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nesting is shown by two spaces per level and children are listed before their parent,
+        # so the module's direct imports are the depth-1 lines just above its own line
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        name = name.strip()
+        if depth == 0:
+            if name == module:
+                total = int(cumulative)
+                top_level = pending
+            pending = {}
+        elif depth == 1:
+            pending[name] = pending.get(name, 0) + int(cumulative)
+    return total, top_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        profiles = sorted((import_profile(module) for _ in range(args.runs)), key=lambda profile: profile[0])
+        median_ms = statistics.median(total for total, _ in profiles) / 1000
+        _, packages = profiles[len(profiles) // 2]
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+        if args.json:
+            print(json.dumps({'module': module, 'runs': args.runs, 'median_ms': round(median_ms, 1),
+                              'heaviest': {name: round(us / 1000, 1) for name, us in heaviest}}))
+            continue
+        print('%s: %.1f ms median over %d runs' % (module, median_ms, args.runs))
+        for name, us in heaviest:
+            print('  %-28s %8.1f ms' % (name, us / 1000))
+
+
+if __name__ == '__main__':
+    main()
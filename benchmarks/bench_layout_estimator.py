@@ -0,0 +1,75 @@
+"""Sizing rows and columns for 1M cells: per-cell Python pass vs. the vectorized LayoutEstimator.
+
+Usage: python benchmarks/bench_layout_estimator.py [--rows 100000] [--cols 10]
+
+The per-cell pass is what the row-height and autosize loops used to do: one
+line-count and one width lookup per cell through Python calls. The estimator
+is timed in two parts: recording the cells (paid while a sheet is written) and
+sizing every row and column from the recorded arrays.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_to_excel import cell_line_count
+from sheet_layout import LayoutEstimator
+
+
+def build_cells(rows, cols):
+    random.seed(0)
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit\nsed']
+    cells = []
+    for row in range(1, rows + 1):
+        col = 1
+        while col <= cols:
+            span = 2 if col < cols and random.random() < 0.1 else 1
+            cells.append((row, col, ' '.join(random.choices(words, k=random.randint(1, 12))), span))
+            col += span
+    return cells
+
+
+def per_cell_pass(cells, widths, rows):
+    lines = [1] * (rows + 1)
+    longest = {}
+    for row, col, text, span in cells:
+        width = sum(widths[c] for c in range(col, col + span))
+        lines[row] = max(lines[row], cell_line_count(text, width))
+        if span == 1 and len(str(text)) > longest.get(col, 0):
+            longest[col] = len(str(text))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--cols', type=int, default=10)
+    args = parser.parse_args()
+
+    cells = build_cells(args.rows, args.cols)
+    widths = [0.0] + [random.uniform(8, 40) for _ in range(args.cols + 1)]
+    print(f"{len(cells)} cells, {sum(1 for cell in cells if cell[3] > 1)} merges")
+
+    start = time.perf_counter()
+    expected = per_cell_pass(cells, widths, args.rows)
+    print(f"per-cell pass:         {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    layout = LayoutEstimator()
+    for row, col, text, span in cells:
+        layout.add(row, col, text, span)
+    print(f"estimator, recording:  {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    lines = layout.row_lines(widths)
+    layout.column_widths()
+    print(f"estimator, sizing:     {time.perf_counter() - start:.3f}s")
+
+    assert lines.tolist() == expected, "row line counts differ between the two passes"
+
+
+if __name__ == '__main__':
+    main()
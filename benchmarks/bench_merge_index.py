@@ -0,0 +1,112 @@
+"""Row-height pass: per-cell merged-range scan vs. the vectorized LayoutEstimator.
+
+Usage: python benchmarks/bench_merge_index.py [--rows 5000] [--cols 10] [--sample 20]
+
+Every row gets one colspan=2 cell, so the default fixture is 50k cells / 5k merges.
+The range scan is quadratic, so it only runs over the first --sample rows and the
+full-sheet time is extrapolated (each row scans every merge, so cost per row is flat).
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from html_to_excel import POINTS_PER_LINE, convert_to_excel
+from sheet_layout import LayoutEstimator, sheet_column_widths
+
+
+def build_fixture(path, rows, cols):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<html><body><table><colgroup>')
+        for _ in range(cols + 1):
+            f.write('<col style="width: 80px">')
+        f.write('</colgroup>')
+        for r in range(rows):
+            f.write('<tr><td colspan="2">merged cell text for row %d</td>' % r)
+            for c in range(cols - 1):
+                f.write('<td>r%dc%d</td>' % (r, c))
+            f.write('</tr>')
+        f.write('</table></body></html>')
+
+
+def legacy_row_heights(worksheet, max_row):
+    for row_index in range(1, max_row + 1):
+        max_lines_in_row = 1
+        for cell in worksheet[row_index]:
+            if not cell.value: continue
+
+            effective_width_units = 0
+            is_merged = False
+            for merged_range in worksheet.merged_cells.ranges:
+                if cell.coordinate in merged_range:
+                    for col_idx in range(merged_range.min_col, merged_range.max_col + 1):
+                        effective_width_units += worksheet.column_dimensions[get_column_letter(col_idx)].width
+                    is_merged = True
+                    break
+            if not is_merged:
+                effective_width_units = worksheet.column_dimensions[cell.column_letter].width
+
+            text = str(cell.value)
+            lines_from_wrapping = 1
+            if effective_width_units > 0:
+                lines_from_wrapping = math.ceil(len(text) / (effective_width_units / 1.1))
+            max_lines_in_row = max(max_lines_in_row, text.count('\n') + 1, lines_from_wrapping)
+
+        worksheet.row_dimensions[row_index].height = max_lines_in_row * POINTS_PER_LINE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--sample', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        html_path = os.path.join(tmpdirname, 'fixture.html')
+        xlsx_path = os.path.join(tmpdirname, 'fixture.xlsx')
+        build_fixture(html_path, args.rows, args.cols)
+
+        start = time.perf_counter()
+        convert_to_excel(html_path, xlsx_path)
+        print(f"convert_to_excel (end to end): {time.perf_counter() - start:.2f}s")
+
+        worksheet = load_workbook(xlsx_path).active
+        print(f"fixture: {args.rows * args.cols} cells, {len(worksheet.merged_cells.ranges)} merges")
+
+        spans = {(r.min_row, r.min_col): r.max_col - r.min_col + 1 for r in worksheet.merged_cells.ranges}
+
+        # Recording happens while convert_to_excel writes; here the metrics are read back from the sheet
+        start = time.perf_counter()
+        layout = LayoutEstimator()
+        for row in worksheet.iter_rows():
+            for cell in row:
+                if cell.value:
+                    layout.add(cell.row, cell.column, str(cell.value), spans.get((cell.row, cell.column), 1))
+        collected = time.perf_counter() - start
+        start = time.perf_counter()
+        layout.apply_row_heights(worksheet, sheet_column_widths(worksheet, layout.max_column))
+        indexed = time.perf_counter() - start
+        indexed_heights = {r: d.height for r, d in worksheet.row_dimensions.items()}
+        print(f"row heights, estimator:    {indexed:.3f}s (+{collected:.3f}s reading the cells back)")
+
+        sample = min(args.sample, worksheet.max_row)
+        start = time.perf_counter()
+        legacy_row_heights(worksheet, sample)
+        legacy = (time.perf_counter() - start) * worksheet.max_row / sample
+        print(f"row heights, range scan:   {legacy:.3f}s (extrapolated from {sample} rows, {legacy / indexed:.0f}x slower)")
+
+        for row_index in range(1, sample + 1):
+            assert worksheet.row_dimensions[row_index].height == indexed_heights[row_index], \
+                f"row {row_index} height differs between the two passes"
+
+
+if __name__ == '__main__':
+    main()
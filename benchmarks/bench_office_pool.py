@@ -0,0 +1,126 @@
+"""OfficePool without Office: throughput per pool size and the recycling, failure, hang and backpressure paths.
+
+Usage: python benchmarks/bench_office_pool.py [--jobs 20] [--delay 0.05]
+
+Drives OfficePool with FakeWorker, which copies the input after delay seconds
+and can be told to fail or hang, so it runs anywhere. Prints jobs per second
+for one and two workers, then checks each pool behaviour and exits non-zero
+with an AssertionError if one doesn't hold.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from office_pool import FakeWorker, OfficePool, PoolBusy
+
+
+def make_pool(workers, **options):
+    """OfficePool of FakeWorkers built with options, and the list every worker it creates is added to"""
+    fake_options = {name: options.pop(name) for name in ('delay', 'hang', 'fail') if name in options}
+
+    def factory():
+        worker = FakeWorker(**fake_options)
+        workers.append(worker)
+        return worker
+    return OfficePool(factory, **options)
+
+
+def run_jobs(pool, tmp, count, prefix):
+    futures = []
+    for index in range(count):
+        input_file = os.path.join(tmp, f'{prefix}{index}.in')
+        with open(input_file, 'w') as f:
+            f.write(f'document {index}')
+        futures.append(pool.submit(input_file, os.path.join(tmp, f'{prefix}{index}.out')))
+    wait(futures)
+    return futures
+
+
+def throughput(tmp, size, jobs, delay):
+    workers = []
+    pool = make_pool(workers, size=size, delay=delay)
+    start = time.perf_counter()
+    futures = run_jobs(pool, tmp, jobs, f'size{size}-')
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    for index, future in enumerate(futures):
+        with open(future.result()) as f:
+            assert f.read() == f'document {index}', f"output {index} doesn't match its input"
+    return jobs / elapsed
+
+
+def check_recycling(tmp):
+    workers = []
+    pool = make_pool(workers, size=1, max_jobs=2)
+    run_jobs(pool, tmp, 5, 'recycle')
+    pool.shutdown()
+    assert workers[0].launches == 3, f"5 jobs at max_jobs=2 should launch 3 times, not {workers[0].launches}"
+
+
+def check_failure(tmp):
+    workers = []
+    pool = make_pool(workers, size=1, fail=True)
+    futures = run_jobs(pool, tmp, 2, 'fail')
+    pool.shutdown()
+    for future in futures:
+        assert isinstance(future.exception(), RuntimeError), f"expected RuntimeError, got {future.exception()!r}"
+    assert workers[0].launches == 2, "a failed conversion should get a fresh instance for the next job"
+
+
+def check_hang(tmp):
+    workers = []
+    pool = make_pool(workers, size=1, hang=True, job_timeout=0.2, check_interval=0.05)
+    futures = run_jobs(pool, tmp, 1, 'hang')
+    deadline = time.monotonic() + 5
+    while len(workers) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    pool.shutdown()
+    assert isinstance(futures[0].exception(), TimeoutError), f"expected TimeoutError, got {futures[0].exception()!r}"
+    assert workers[0].retired, "the hung worker should be retired"
+    assert len(workers) == 2, "a replacement worker should be started"
+
+
+def check_backpressure(tmp):
+    workers = []
+    pool = make_pool(workers, size=1, queue_size=1, hang=True)
+    input_file = os.path.join(tmp, 'busy.in')
+    with open(input_file, 'w') as f:
+        f.write('busy')
+    running = pool.submit(input_file, os.path.join(tmp, 'busy0.out'))
+    while workers[0].current is None:
+        time.sleep(0.01)
+    queued = pool.submit(input_file, os.path.join(tmp, 'busy1.out'))
+    try:
+        pool.submit(input_file, os.path.join(tmp, 'busy2.out'), timeout=0.1)
+    except PoolBusy:
+        pass
+    else:
+        raise AssertionError("a full queue should raise PoolBusy")
+    workers[0].release()
+    wait([running, queued])
+    pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=0.05)
+    args = parser.parse_args()
+    logging.getLogger('office_pool').setLevel(logging.CRITICAL)  # the failure and hang checks log errors on purpose
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (1, 2):
+            print('%d worker(s) %8.1f jobs/s' % (size, throughput(tmp, size, args.jobs, args.delay)))
+        for check in (check_recycling, check_failure, check_hang, check_backpressure):
+            check(tmp)
+            print(f'{check.__name__[6:]:<12} ok')
+
+
+if __name__ == '__main__':
+    main()
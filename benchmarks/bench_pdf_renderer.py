@@ -0,0 +1,84 @@
+"""HTML -> PDF latency: fresh in-process WeasyPrint render vs. pre-warmed PdfRenderer workers.
+
+Usage: python benchmarks/bench_pdf_renderer.py [--docs 50] [--workers 2]
+
+Each document is a one-page table, which is where per-call start-up (imports,
+fontconfig, user-agent CSS) dominates. The cold path imports WeasyPrint in a
+fresh interpreter per call, as a short-lived worker would; the warm path sends
+the same documents to a started PdfRenderer. Reports p50/p99 in milliseconds.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_renderer import PdfRenderer
+
+COLD_RENDER = (
+    "import sys\n"
+    "from weasyprint import HTML\n"
+    "HTML(string=open(sys.argv[1], encoding='utf-8').read()).write_pdf(sys.argv[2])\n"
+)
+
+
+def build_fixture(path, index):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<html><body><h1>Report %d</h1><table>' % index)
+        for r in range(20):
+            f.write('<tr>' + ''.join('<td>r%dc%d</td>' % (r, c) for c in range(6)) + '</tr>')
+        f.write('</table></body></html>')
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))]
+    return statistics.median(ordered) * 1000, p99 * 1000
+
+
+def time_calls(render, fixtures, out_dir):
+    samples = []
+    for i, fixture in enumerate(fixtures):
+        started = time.perf_counter()
+        render(fixture, os.path.join(out_dir, '%d.pdf' % i))
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = []
+        for i in range(args.docs):
+            fixtures.append(os.path.join(tmp, '%d.html' % i))
+            build_fixture(fixtures[-1], i)
+
+        def cold(fixture, output_file):
+            subprocess.run([sys.executable, '-c', COLD_RENDER, fixture, output_file], check=True)
+
+        cold_samples = time_calls(cold, fixtures, tmp)
+
+        renderer = PdfRenderer(max_workers=args.workers)
+        renderer.start()
+        try:
+            warm_samples = time_calls(lambda fixture, output_file: renderer.render(output_file, filename=fixture),
+                                      fixtures, tmp)
+        finally:
+            renderer.shutdown()
+
+    print('%d one-page documents' % args.docs)
+    for label, samples in (('cold render', cold_samples), ('warm workers', warm_samples)):
+        p50, p99 = percentiles(samples)
+        print('  %-13s p50 %8.1f ms   p99 %8.1f ms' % (label, p50, p99))
+
+
+if __name__ == '__main__':
+    main()
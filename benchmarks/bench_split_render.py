@@ -0,0 +1,84 @@
+"""HTML -> PDF for one long table: a single WeasyPrint pass vs. split rendering across workers.
+
+Usage: python benchmarks/bench_split_render.py [--rows 10000] [--cols 8] [--workers 4] [--chunk-rows 500]
+
+The fixture is a striped table with a <thead> and a page-number footer, so the
+split path has to repeat headers and renumber pages. Each mode runs in a fresh
+interpreter and reports wall time, the peak RSS of its largest process and the
+page count of the result, which should match between the two.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RUN_MODE = (
+    "import json, resource, sys\n"
+    "from pdf_renderer import write_pdf\n"
+    "from pdf_split import render_split\n"
+    "mode, html_file, pdf_file, workers, chunk_rows = sys.argv[1:6]\n"
+    "if __name__ == '__main__':\n"
+    "    if mode == 'single':\n"
+    "        write_pdf(pdf_file, filename=html_file)\n"
+    "    else:\n"
+    "        render_split(html_file, pdf_file, budget=int(chunk_rows), workers=int(workers))\n"
+    "    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\n"
+    "               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)\n"
+    "    print(json.dumps({'peak_kb': peak}))\n"
+)
+
+
+def build_fixture(path, rows, cols):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<html><head><style>'
+                '@page { size: A4; margin: 15mm; @bottom-center { content: "Page " counter(page) " of " counter(pages) } }'
+                'table { border-collapse: collapse; width: 100% } td, th { border: 1px solid #999; padding: 2px 4px }'
+                'tbody tr:nth-child(even) { background: #eee }'
+                '</style></head><body><h1>Ledger</h1><table><thead><tr>')
+        f.write(''.join('<th>Column %d</th>' % c for c in range(cols)))
+        f.write('</tr></thead><tbody>')
+        for r in range(rows):
+            f.write('<tr>' + ''.join('<td>r%dc%d</td>' % (r, c) for c in range(cols)) + '</tr>')
+        f.write('</tbody></table></body></html>')
+
+
+def run_mode(mode, html_file, pdf_file, workers, chunk_rows):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', RUN_MODE, mode, html_file, pdf_file, str(workers), str(chunk_rows)],
+                               cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"{mode} render failed:\n{completed.stderr[-2000:]}")
+    return elapsed, json.loads(completed.stdout.splitlines()[-1])['peak_kb']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--cols', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-rows', type=int, default=500)
+    args = parser.parse_args()
+
+    from pypdf import PdfReader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        html_file = os.path.join(tmp, 'table.html')
+        build_fixture(html_file, args.rows, args.cols)
+        print(f"{args.rows} rows x {args.cols} columns, {os.path.getsize(html_file) / 1e6:.1f} MB of HTML")
+
+        for mode in ('single', 'split'):
+            pdf_file = os.path.join(tmp, f'{mode}.pdf')
+            elapsed, peak_kb = run_mode(mode, html_file, pdf_file, args.workers, args.chunk_rows)
+            pages = len(PdfReader(pdf_file).pages)
+            print('%-6s %8.1fs  peak %6.0f MB  %d pages' % (mode, elapsed, peak_kb / 1024, pages))
+
+
+if __name__ == '__main__':
+    main()
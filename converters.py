@@ -0,0 +1,163 @@
+import functools
+import os
+import platform
+import shutil
+from collections import namedtuple
+from pdf_renderer import BASE_STYLESHEET, write_pdf
+from pdf_split import PDF_SPLIT_MIN_BYTES, render_split
+from office_pool import ExcelWorker, WordWorker, get_pool
+from result_cache import file_digest
+
+EXCEL_WRITE_ONLY_MIN_BYTES = 20 * 1024 * 1024  # stream larger HTML inputs into a write-only workbook
+CONVERTER_VERSION = 5  # bump whenever converter output changes so cached results are not served
+# 'com' drives Excel (Windows only), 'html' renders every sheet through xlsx_to_html + WeasyPrint
+EXCEL_PDF_ENGINE = os.environ.get('EXCEL_PDF_ENGINE') or ('com' if platform.system() == "Windows" else 'html')
+# 'com' drives Word (Windows only), 'docx2pdf' needs Word too (Windows/macOS), 'html' renders through docx_to_html
+DOCX_PDF_ENGINE = os.environ.get('DOCX_PDF_ENGINE') or ('com' if platform.system() == "Windows" else 'html')
+
+ConversionJob = namedtuple('ConversionJob', ['name', 'input_file', 'ext', 'output_format', 'output_file',
+                                             'write_only_min_bytes', 'excel_pdf_engine', 'docx_pdf_engine',
+                                             'sheet_per_table'])
+ConversionJob.__new__.__defaults__ = (EXCEL_WRITE_ONLY_MIN_BYTES, EXCEL_PDF_ENGINE, DOCX_PDF_ENGINE, False)
+
+# (source extension, output format) -> function running a ConversionJob. Backends (pandas/bs4/openpyxl,
+# the DOCX/XLSX renderers, COM) are imported inside the converters, so importing this module stays
+# cheap and a process only loads what the pairs it is actually asked for need.
+CONVERTERS = {}
+OUTPUT_FORMATS = ('pdf', 'excel')
+
+
+def register_converter(ext, output_format):
+    def register(func):
+        CONVERTERS[(ext, output_format)] = func
+        return func
+    return register
+
+
+def get_converter(ext, output_format):
+    output_format = output_format.lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    try:
+        return CONVERTERS[(ext, output_format)]
+    except KeyError:
+        raise ValueError(f"Converting {ext} to {'PDF' if output_format == 'pdf' else 'Excel'} is not supported")
+
+
+def convert_docx_to_pdf(input_file, output_file, engine=DOCX_PDF_ENGINE):
+    if engine == 'html':
+        convert_docx_to_pdf_html(input_file, output_file)
+    elif engine == 'com':
+        # Long-lived Word instances instead of one start-up per file
+        get_pool(WordWorker).convert(input_file, output_file)
+    else:
+        from docx2pdf import convert as docx_convert
+        docx_convert(input_file, output_file)
+
+
+def convert_docx_to_pdf_html(input_file, output_file):
+    from docx_to_html import iter_document_html
+    # Paragraphs, runs, tables, images and paragraph/character styles, parsed
+    # straight from the OOXML package; no Word involved. document.xml is streamed
+    # block by block into an HTML file next to the output, images into a folder.
+    html_file = f'{output_file}.html'
+    media_dir = f'{output_file}.media'
+    try:
+        with open(html_file, 'w', encoding='utf-8') as f:
+            f.writelines(iter_document_html(input_file, media_dir))
+        write_pdf(output_file, filename=html_file)
+    finally:
+        if os.path.exists(html_file):
+            os.remove(html_file)
+        shutil.rmtree(media_dir, ignore_errors=True)
+
+
+def convert_excel_to_pdf(input_file, output_file):
+    # Same page setup as before (landscape, fit to one page wide), run on a pooled Excel instance
+    get_pool(ExcelWorker).convert(input_file, output_file)
+
+
+def convert_excel_to_pdf_html(input_file, output_file):
+    # Column widths, fills, fonts, borders and merges of every visible sheet, one
+    # landscape fit-to-width page run per sheet; no Office process involved.
+    # Plain grids are laid out straight into PDF pages; anything styled or merged
+    # is rendered chunk by chunk into an HTML file next to the output.
+    from pdf_table import EXCEL_PDF_TABLES, convert_plain_workbook
+    if EXCEL_PDF_TABLES and convert_plain_workbook(input_file, output_file):
+        return
+    from xlsx_to_html import iter_workbook_html
+    html_file = f'{output_file}.html'
+    try:
+        with open(html_file, 'w', encoding='utf-8') as f:
+            f.writelines(iter_workbook_html(input_file))
+        write_pdf(output_file, filename=html_file)
+    finally:
+        if os.path.exists(html_file):
+            os.remove(html_file)
+
+
+def convert_html_to_pdf(input_file, output_file, split_min_bytes=PDF_SPLIT_MIN_BYTES):
+    # Large documents are laid out in chunks on several processes instead of in one WeasyPrint pass
+    if os.path.getsize(input_file) >= split_min_bytes:
+        render_split(input_file, output_file)
+    else:
+        write_pdf(output_file, filename=input_file)
+
+
+@functools.lru_cache(maxsize=None)
+def stylesheet_digest(path):
+    """SHA-256 of a stylesheet, read once per process just as the renderers parse it once"""
+    return file_digest(path) if path else None
+
+
+def cache_parts(job):
+    """Everything besides the input bytes that determines a job's output"""
+    output_format = job.output_format.lower()
+    if output_format == 'pdf':
+        # Every WeasyPrint render applies PDF_BASE_STYLESHEET; plain workbooks may skip WeasyPrint entirely
+        settings = (stylesheet_digest(BASE_STYLESHEET),)
+        if job.ext == 'xlsx' and job.excel_pdf_engine == 'html':
+            from pdf_table import EXCEL_PDF_TABLES
+            settings += (EXCEL_PDF_TABLES,)
+    else:
+        settings = (os.path.getsize(job.input_file) >= job.write_only_min_bytes,)
+    return (job.ext, output_format, job.excel_pdf_engine, job.docx_pdf_engine, job.sheet_per_table,
+            *settings, CONVERTER_VERSION)
+
+
+@register_converter('docx', 'pdf')
+def _docx_to_pdf(job):
+    convert_docx_to_pdf(job.input_file, job.output_file, job.docx_pdf_engine)
+
+
+@register_converter('xlsx', 'pdf')
+def _xlsx_to_pdf(job):
+    if job.excel_pdf_engine == 'html':
+        convert_excel_to_pdf_html(job.input_file, job.output_file)
+    else:
+        convert_excel_to_pdf(job.input_file, job.output_file)
+
+
+@register_converter('html', 'pdf')
+def _html_to_pdf(job):
+    convert_html_to_pdf(job.input_file, job.output_file)
+
+
+@register_converter('html', 'excel')
+def _html_to_excel(job):
+    from html_to_excel import convert_to_excel
+    write_only = os.path.getsize(job.input_file) >= job.write_only_min_bytes
+    convert_to_excel(job.input_file, job.output_file, write_only=write_only, sheet_per_table=job.sheet_per_table)
+
+
+@register_converter('xlsx', 'excel')
+def _xlsx_to_excel(job):
+    from xlsx_reader import copy_workbook_values
+    # Cell values of every sheet, streamed through in row chunks
+    copy_workbook_values(job.input_file, job.output_file)
+
+
+def convert_file(job):
+    """Run one ConversionJob and return its output path; raises on failure"""
+    get_converter(job.ext, job.output_format)(job)
+    return job.output_file
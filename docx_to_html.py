@@ -0,0 +1,456 @@
+import html
+import logging
+import os
+import posixpath
+from pathlib import Path
+from xml.etree.ElementTree import fromstring, iterparse
+from zipfile import ZipFile
+
+logger = logging.getLogger(__name__)
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+WP_NS = 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+IMAGE_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+HYPERLINK_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink'
+
+TWIPS_PER_PX = 15  # 1440 twips per inch, 96 px per inch
+EMU_PER_PX = 9525
+JUSTIFY = {'left': 'left', 'start': 'left', 'center': 'center', 'right': 'right', 'end': 'right',
+           'both': 'justify', 'distribute': 'justify'}
+HEADING_NAMES = {'title': 1, **{f'heading {level}': level for level in range(1, 7)}}
+HIGHLIGHT_COLORS = {'yellow': '#FFFF00', 'green': '#00FF00', 'cyan': '#00FFFF', 'magenta': '#FF00FF',
+                    'blue': '#0000FF', 'red': '#FF0000', 'darkBlue': '#000080', 'darkCyan': '#008080',
+                    'darkGreen': '#008000', 'darkMagenta': '#800080', 'darkRed': '#800000',
+                    'darkYellow': '#808000', 'darkGray': '#808080', 'lightGray': '#C0C0C0', 'black': '#000000'}
+
+BASE_CSS = '''
+body { font-family: Calibri, Carlito, Arial, sans-serif; font-size: 11pt; line-height: 1.15; }
+p { margin: 0 0 8pt 0; }
+table.docx { border-collapse: collapse; margin: 0 0 8pt 0; }
+table.docx td { vertical-align: top; padding: 0 5pt; }
+table.docx td p { margin: 0; }
+.page-break { page-break-after: always; }
+'''
+
+
+def _w(tag):
+    return f'{{{W_NS}}}{tag}'
+
+
+def _val(element, tag, attribute='val'):
+    child = element.find(_w(tag)) if element is not None else None
+    if child is None:
+        return None
+    return child.get(_w(attribute))
+
+
+def _on(element, tag):
+    """Whether a toggle property (w:b, w:i, ...) is present and not switched off"""
+    child = element.find(_w(tag)) if element is not None else None
+    return child is not None and child.get(_w('val'), 'true') not in ('0', 'false', 'off')
+
+
+def run_css(rpr):
+    """CSS declarations for a w:rPr element"""
+    if rpr is None:
+        return {}
+    css = {}
+    if _on(rpr, 'b'):
+        css['font-weight'] = 'bold'
+    if _on(rpr, 'i'):
+        css['font-style'] = 'italic'
+    decorations = []
+    if rpr.find(_w('u')) is not None and _val(rpr, 'u') != 'none':
+        decorations.append('underline')
+    if _on(rpr, 'strike') or _on(rpr, 'dstrike'):
+        decorations.append('line-through')
+    if decorations:
+        css['text-decoration'] = ' '.join(decorations)
+    if _val(rpr, 'sz'):
+        css['font-size'] = f'{int(_val(rpr, "sz")) / 2:g}pt'
+    color = _val(rpr, 'color')
+    if color and color != 'auto':
+        css['color'] = f'#{color}'
+    highlight = _val(rpr, 'highlight')
+    if highlight in HIGHLIGHT_COLORS:
+        css['background-color'] = HIGHLIGHT_COLORS[highlight]
+    fonts = rpr.find(_w('rFonts'))
+    if fonts is not None and fonts.get(_w('ascii')):
+        css['font-family'] = f'"{fonts.get(_w("ascii"))}", Calibri, Carlito, Arial, sans-serif'
+    vertical = _val(rpr, 'vertAlign')
+    if vertical in ('superscript', 'subscript'):
+        css['vertical-align'] = 'super' if vertical == 'superscript' else 'sub'
+        css['font-size'] = 'smaller'
+    if _on(rpr, 'caps'):
+        css['text-transform'] = 'uppercase'
+    if _on(rpr, 'vanish'):
+        css['display'] = 'none'
+    return css
+
+
+def paragraph_css(ppr):
+    """CSS declarations for a w:pPr element (alignment, indentation, spacing)"""
+    if ppr is None:
+        return {}
+    css = {}
+    if _val(ppr, 'jc') in JUSTIFY:
+        css['text-align'] = JUSTIFY[_val(ppr, 'jc')]
+    indent = ppr.find(_w('ind'))
+    if indent is not None:
+        left = indent.get(_w('left')) or indent.get(_w('start'))
+        if left:
+            css['margin-left'] = f'{int(left) / TWIPS_PER_PX:g}px'
+        if indent.get(_w('firstLine')):
+            css['text-indent'] = f'{int(indent.get(_w("firstLine"))) / TWIPS_PER_PX:g}px'
+        elif indent.get(_w('hanging')):
+            css['text-indent'] = f'-{int(indent.get(_w("hanging"))) / TWIPS_PER_PX:g}px'
+    spacing = ppr.find(_w('spacing'))
+    if spacing is not None:
+        if spacing.get(_w('before')):
+            css['margin-top'] = f'{int(spacing.get(_w("before"))) / 20:g}pt'
+        if spacing.get(_w('after')):
+            css['margin-bottom'] = f'{int(spacing.get(_w("after"))) / 20:g}pt'
+    return css
+
+
+def _declarations(css):
+    return '; '.join(f'{name}: {value}' for name, value in css.items())
+
+
+class DocxStyles:
+    """Paragraph and character styles from word/styles.xml, resolved through basedOn chains"""
+
+    def __init__(self, xml=None):
+        self._styles = {}
+        self.default_paragraph = None
+        self.default_run_css = {}
+        if xml is None:
+            return
+        root = fromstring(xml)
+        defaults = root.find(f'{_w("docDefaults")}/{_w("rPrDefault")}/{_w("rPr")}')
+        self.default_run_css = run_css(defaults)
+        for style in root.iter(_w('style')):
+            style_id = style.get(_w('styleId'))
+            self._styles[style_id] = {
+                'type': style.get(_w('type')),
+                'name': (_val(style, 'name') or '').lower(),
+                'based_on': _val(style, 'basedOn'),
+                'paragraph': paragraph_css(style.find(_w('pPr'))),
+                'run': run_css(style.find(_w('rPr'))),
+                'numbered': style.find(f'{_w("pPr")}/{_w("numPr")}') is not None,
+                'bordered': _has_borders(style.find(f'{_w("tblPr")}/{_w("tblBorders")}')),
+            }
+            if style.get(_w('type')) == 'paragraph' and style.get(_w('default')) in ('1', 'true'):
+                self.default_paragraph = style_id
+
+    def resolved(self, style_id):
+        paragraph, run = {}, {}
+        seen = set()
+        while style_id in self._styles and style_id not in seen:
+            seen.add(style_id)
+            style = self._styles[style_id]
+            paragraph = {**style['paragraph'], **paragraph}
+            run = {**style['run'], **run}
+            style_id = style['based_on']
+        return paragraph, run
+
+    def _inherited(self, style_id, key):
+        seen = set()
+        while style_id in self._styles and style_id not in seen:
+            seen.add(style_id)
+            if self._styles[style_id][key]:
+                return True
+            style_id = self._styles[style_id]['based_on']
+        return False
+
+    def numbered(self, style_id):
+        """Whether paragraphs in this style are list items (List Bullet, List Number, ...)"""
+        return self._inherited(style_id, 'numbered')
+
+    def bordered(self, style_id):
+        """Whether a table style draws cell borders (Table Grid and friends)"""
+        return self._inherited(style_id, 'bordered')
+
+    def heading_level(self, style_id):
+        style = self._styles.get(style_id)
+        return HEADING_NAMES.get(style['name']) if style else None
+
+    def stylesheet(self):
+        rules = [f'body {{ {_declarations(self.default_run_css)} }}'] if self.default_run_css else []
+        for style_id, style in self._styles.items():
+            if style['type'] not in ('paragraph', 'character'):
+                continue
+            paragraph, run = self.resolved(style_id)
+            css = {**paragraph, **run} if style['type'] == 'paragraph' else run
+            if css:
+                rules.append(f'.{_class_name(style_id)} {{ {_declarations(css)} }}')
+        return '\n'.join(rules)
+
+
+def _has_borders(borders):
+    return borders is not None and any(side.get(_w('val')) not in (None, 'nil', 'none') for side in borders)
+
+
+def _class_name(style_id):
+    return 'ds-' + ''.join(c if c.isalnum() or c in '-_' else '_' for c in style_id)
+
+
+class DocxPackage:
+    """Relationships and media of an open DOCX package; images are extracted to media_dir on first use"""
+
+    def __init__(self, archive, media_dir):
+        self.archive = archive
+        self.media_dir = media_dir
+        self.relationships = {}
+        self._extracted = {}
+        rels_name = 'word/_rels/document.xml.rels'
+        if rels_name in archive.namelist():
+            for rel in fromstring(archive.read(rels_name)).iter(f'{{{PKG_REL_NS}}}Relationship'):
+                self.relationships[rel.get('Id')] = (rel.get('Type'), rel.get('Target'), rel.get('TargetMode'))
+
+    def hyperlink(self, rel_id):
+        rel_type, target, _ = self.relationships.get(rel_id, (None, None, None))
+        return target if rel_type == HYPERLINK_REL else None
+
+    def image_uri(self, rel_id):
+        rel_type, target, mode = self.relationships.get(rel_id, (None, None, None))
+        if rel_type != IMAGE_REL or mode == 'External':
+            return None
+        if rel_id not in self._extracted:
+            member = posixpath.normpath(posixpath.join('word', target)).lstrip('/')
+            if member not in self.archive.namelist():
+                return None
+            os.makedirs(self.media_dir, exist_ok=True)
+            # Relationship ids and targets come from the upload, so the file name is ours;
+            # only an alphanumeric extension is kept from the member name
+            extension = posixpath.splitext(member)[1]
+            if not extension[1:].isalnum():
+                extension = ''
+            media_dir = Path(self.media_dir).resolve()
+            path = (media_dir / f'image{len(self._extracted) + 1}{extension}').resolve()
+            if path.parent != media_dir:
+                return None
+            with self.archive.open(member) as src, open(path, 'wb') as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            self._extracted[rel_id] = path.as_uri()
+        return self._extracted[rel_id]
+
+
+class DocxRenderer:
+    """Turns body-level w:p / w:tbl elements into HTML"""
+
+    def __init__(self, styles, package):
+        self.styles = styles
+        self.package = package
+
+    def block(self, element):
+        if element.tag == _w('p'):
+            return self.paragraph(element)
+        if element.tag == _w('tbl'):
+            return self.table(element)
+        if element.tag == _w('sdt'):
+            content = element.find(_w('sdtContent'))
+            return ''.join(self.block(child) for child in content) if content is not None else ''
+        return ''
+
+    def paragraph(self, p):
+        ppr = p.find(_w('pPr'))
+        style_id = _val(ppr, 'pStyle') or self.styles.default_paragraph
+        css = paragraph_css(ppr)
+        prefix = ''
+        num_pr = ppr.find(_w('numPr')) if ppr is not None else None
+        if num_pr is not None or self.styles.numbered(style_id):
+            # Numbering definitions are not resolved; list items get a bullet and their level's indent
+            level = int(_val(num_pr, 'ilvl') or 0)
+            css.setdefault('margin-left', f'{24 * (level + 1)}px')
+            css.setdefault('text-indent', '-12px')
+            prefix = '• '
+        content = prefix + self.inline(p)
+        if not content.strip():
+            content = '&nbsp;'
+
+        level = self.styles.heading_level(style_id)
+        tag = f'h{level}' if level else 'p'
+        attributes = f' class="{_class_name(style_id)}"' if style_id else ''
+        if css:
+            attributes += f' style="{_declarations(css)}"'
+        html_text = f'<{tag}{attributes}>{content}</{tag}>\n'
+        if any(br.get(_w('type')) == 'page' for br in p.iter(_w('br'))):
+            html_text += '<div class="page-break"></div>\n'
+        return html_text
+
+    def inline(self, parent):
+        parts = []
+        for child in parent:
+            if child.tag == _w('r'):
+                parts.append(self.run(child))
+            elif child.tag == _w('hyperlink'):
+                target = self.package.hyperlink(child.get(f'{{{R_NS}}}id'))
+                text = self.inline(child)
+                parts.append(f'<a href="{html.escape(target)}">{text}</a>' if target else text)
+            elif child.tag in (_w('ins'), _w('smartTag'), _w('fldSimple'), _w('customXml')):
+                parts.append(self.inline(child))
+            elif child.tag == _w('sdt'):
+                content = child.find(_w('sdtContent'))
+                if content is not None:
+                    parts.append(self.inline(content))
+        return ''.join(parts)
+
+    def run(self, r):
+        rpr = r.find(_w('rPr'))
+        pieces = []
+        for child in r:
+            if child.tag == _w('t'):
+                pieces.append(html.escape(child.text or ''))
+            elif child.tag == _w('tab'):
+                pieces.append(' ')
+            elif child.tag in (_w('br'), _w('cr')) and child.get(_w('type')) != 'page':
+                pieces.append('<br>')
+            elif child.tag == _w('noBreakHyphen'):
+                pieces.append('‑')
+            elif child.tag == _w('drawing'):
+                pieces.append(self.drawing(child))
+        text = ''.join(pieces)
+        if not text:
+            return ''
+        css = run_css(rpr)
+        character_style = _val(rpr, 'rStyle')
+        attributes = f' class="{_class_name(character_style)}"' if character_style else ''
+        if css:
+            attributes += f' style="{_declarations(css)}"'
+        return f'<span{attributes}>{text}</span>' if attributes else text
+
+    def drawing(self, drawing):
+        blip = drawing.find(f'.//{{{A_NS}}}blip')
+        if blip is None:
+            return ''
+        uri = self.package.image_uri(blip.get(f'{{{R_NS}}}embed'))
+        if uri is None:
+            return ''
+        size = ''
+        extent = drawing.find(f'.//{{{WP_NS}}}extent')
+        if extent is not None:
+            width = int(extent.get('cx', 0)) / EMU_PER_PX
+            height = int(extent.get('cy', 0)) / EMU_PER_PX
+            size = f' style="width: {width:.0f}px; height: {height:.0f}px"'
+        return f'<img src="{uri}"{size}>'
+
+    def table(self, tbl):
+        widths = [int(col.get(_w('w'), 0)) / TWIPS_PER_PX for col in tbl.iter(_w('gridCol'))]
+        tbl_pr = tbl.find(_w('tblPr'))
+        borders = tbl_pr.find(_w('tblBorders')) if tbl_pr is not None else None
+        bordered = _has_borders(borders) if borders is not None else self.styles.bordered(_val(tbl_pr, 'tblStyle'))
+
+        # Lay cells out on the grid first so vertically merged cells can get their rowspan
+        grid = []
+        for tr in tbl.findall(_w('tr')):
+            row = []
+            column = 0
+            for tc in tr.findall(_w('tc')):
+                tcpr = tc.find(_w('tcPr'))
+                span = int(_val(tcpr, 'gridSpan') or 1)
+                vmerge = tcpr.find(_w('vMerge')) if tcpr is not None else None
+                merge = None if vmerge is None else (vmerge.get(_w('val')) or 'continue')
+                row.append({'tc': tc, 'column': column, 'span': span, 'merge': merge, 'rowspan': 1})
+                column += span
+            grid.append(row)
+        for row_index, row in enumerate(grid):
+            for cell in row:
+                if cell['merge'] != 'restart':
+                    continue
+                for below in grid[row_index + 1:]:
+                    match = next((c for c in below if c['column'] == cell['column']), None)
+                    if match is None or match['merge'] != 'continue':
+                        break
+                    cell['rowspan'] += 1
+
+        cell_border = {'border': '1px solid #000'} if bordered else {}
+        parts = ['<table class="docx">']
+        if widths:
+            parts.append('<colgroup>' + ''.join(f'<col style="width: {width:.0f}px">' for width in widths) + '</colgroup>')
+        for row in grid:
+            parts.append('<tr>')
+            for cell in row:
+                if cell['merge'] == 'continue':
+                    continue
+                attributes = ''
+                if cell['span'] > 1:
+                    attributes += f' colspan="{cell["span"]}"'
+                if cell['rowspan'] > 1:
+                    attributes += f' rowspan="{cell["rowspan"]}"'
+                css = dict(cell_border)
+                shading = _val(cell['tc'].find(_w('tcPr')), 'shd', 'fill')
+                if shading and shading != 'auto':
+                    css['background-color'] = f'#{shading}'
+                if css:
+                    attributes += f' style="{_declarations(css)}"'
+                content = ''.join(self.block(child) for child in cell['tc'] if child.tag in (_w('p'), _w('tbl'), _w('sdt')))
+                parts.append(f'<td{attributes}>{content}</td>')
+            parts.append('</tr>')
+        parts.append('</table>\n')
+        return ''.join(parts)
+
+
+def page_css(sect_pr):
+    """@page size and margins from the document's final w:sectPr"""
+    if sect_pr is None:
+        return ''
+    rules = []
+    size = sect_pr.find(_w('pgSz'))
+    if size is not None and size.get(_w('w')) and size.get(_w('h')):
+        rules.append(f'size: {int(size.get(_w("w"))) / 1440:g}in {int(size.get(_w("h"))) / 1440:g}in')
+    margins = sect_pr.find(_w('pgMar'))
+    if margins is not None:
+        sides = [int(margins.get(_w(side), 1440)) / 1440 for side in ('top', 'right', 'bottom', 'left')]
+        rules.append('margin: ' + ' '.join(f'{side:g}in' for side in sides))
+    return f'@page {{ {"; ".join(rules)} }}' if rules else ''
+
+
+def iter_document_html(input_file, media_dir):
+    """Yield an HTML rendering of a DOCX file: paragraphs, runs, tables, images and basic styles.
+
+    word/document.xml is streamed with iterparse and each body-level paragraph or
+    table is rendered and dropped as soon as it is complete, so memory does not
+    grow with the document. Images are copied to media_dir and linked by file URI.
+    """
+    with ZipFile(input_file) as archive:
+        names = set(archive.namelist())
+        styles = DocxStyles(archive.read('word/styles.xml') if 'word/styles.xml' in names else None)
+        renderer = DocxRenderer(styles, DocxPackage(archive, media_dir))
+
+        yield '<!DOCTYPE html><html><head><meta charset="utf-8"><style>'
+        yield BASE_CSS
+        yield styles.stylesheet()
+        yield '</style></head><body>\n'
+
+        depth = 0
+        body = None
+        sect_pr = None
+        blocks = 0
+        with archive.open('word/document.xml') as source:
+            for event, element in iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if depth == 2 and element.tag == _w('body'):
+                        body = element
+                    continue
+                depth -= 1
+                # Children of w:body are at depth 2 once their end tag has been seen
+                if depth == 2 and body is not None:
+                    if element.tag == _w('sectPr'):
+                        sect_pr = element
+                        continue
+                    yield renderer.block(element)
+                    blocks += 1
+                    body.clear()
+
+        # @page can sit anywhere in the document's stylesheets; the section properties come last
+        yield f'<style>{page_css(sect_pr)}</style>\n</body></html>'
+        logger.debug(f"Rendered {blocks} blocks from {input_file}")
@@ -0,0 +1,111 @@
+import logging
+import mimetypes
+import os
+import secrets
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_TOKEN_TTL = 60 * 60
+
+
+class DownloadServer:
+    """Serves registered files from disk under unguessable, expiring URLs.
+
+    Runs a small threaded HTTP server next to the Streamlit app so downloads
+    never pass through the Streamlit process's memory: each response is sent
+    with socket.sendfile(), or in fixed-size blocks where that is unavailable.
+    """
+
+    def __init__(self, host='0.0.0.0', port=8502, base_url=None, token_ttl=DOWNLOAD_TOKEN_TTL):
+        self.token_ttl = token_ttl
+        self._tokens = {}
+        self._paths = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_port
+        self.base_url = base_url.rstrip('/') if base_url else None
+        threading.Thread(target=self._httpd.serve_forever, name='download-server', daemon=True).start()
+        logger.info(f"Download server listening on {host}:{self.port}")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            host=os.environ.get('DOWNLOAD_SERVER_HOST', '0.0.0.0'),
+            port=int(os.environ.get('DOWNLOAD_SERVER_PORT', 8502)),
+            base_url=os.environ.get('DOWNLOAD_BASE_URL'),
+            token_ttl=int(os.environ.get('DOWNLOAD_TOKEN_TTL', DOWNLOAD_TOKEN_TTL)),
+        )
+
+    def url_for(self, path, name, base_url=None):
+        """Register path for download as name and return its URL, valid for at least token_ttl / 2 seconds.
+
+        The URL starts with base_url, by default the server's configured one.
+        Registering the same file again reuses its token while it has more than
+        half its lifetime left, so Streamlit reruns don't mint a new link each time.
+        """
+        base_url = (base_url or self.base_url).rstrip('/')
+        now = time.time()
+        with self._lock:
+            for expired in [t for t, (_, _, expires) in self._tokens.items() if expires < now]:
+                path_key = self._tokens.pop(expired)[:2]
+                if self._paths.get(path_key) == expired:
+                    del self._paths[path_key]
+            token = self._paths.get((path, name))
+            if token not in self._tokens or self._tokens[token][2] - now < self.token_ttl / 2:
+                token = secrets.token_urlsafe(24)
+                self._tokens[token] = (path, name, now + self.token_ttl)
+                self._paths[(path, name)] = token
+        return f'{base_url}/download/{token}/{quote(name)}'
+
+    def lookup(self, token):
+        with self._lock:
+            path, name, expires = self._tokens.get(token, (None, None, 0))
+        if expires < time.time():
+            return None, None
+        return path, name
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _handler_for(server):
+    class DownloadHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split('/')
+            if len(parts) < 3 or parts[1] != 'download':
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            path, name = server.lookup(parts[2])
+            if path is None:
+                self.send_error(HTTPStatus.GONE, 'Download link has expired')
+                return
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                self.send_error(HTTPStatus.GONE, 'File is no longer available')
+                return
+
+            with f:
+                self.send_response(HTTPStatus.OK)
+                self.send_header('Content-Type', mimetypes.guess_type(name)[0] or 'application/octet-stream')
+                self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+                self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(name)}")
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.flush()
+                try:
+                    self.connection.sendfile(f)
+                except (BrokenPipeError, ConnectionResetError):
+                    logger.debug(f"Client went away while downloading {name}")
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return DownloadHandler
@@ -0,0 +1,54 @@
+import io
+import logging
+import os
+import shutil
+import tempfile
+from flask import send_file
+
+logger = logging.getLogger(__name__)
+
+
+def make_workdir():
+    """Per-request working directory for uploads and outputs; removed by send_and_cleanup"""
+    return tempfile.mkdtemp(prefix='pdfconverter-')
+
+
+def remove_workdir(workdir):
+    try:
+        shutil.rmtree(workdir)
+    except OSError as e:
+        logger.error(f"Could not remove working directory {workdir}: {e}")
+
+
+class _WorkdirFile(io.BufferedReader):
+    """Read-only file that removes its working directory when it is closed"""
+
+    def __init__(self, path, workdir):
+        super().__init__(io.FileIO(path, 'rb'))
+        self.workdir = workdir
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.workdir is not None:
+                remove_workdir(self.workdir)
+                self.workdir = None
+
+
+def send_and_cleanup(path, workdir, download_name):
+    """Send path as an attachment straight from workdir and remove workdir once the response is closed.
+
+    The open file goes to the WSGI server's file wrapper, so the body is streamed in
+    blocks (or with sendfile() where the server supports it) and never read into
+    memory. Response.call_on_close is not used because send_file responses bypass it;
+    the server closes the file instead, which is what removes the directory.
+    """
+    try:
+        size = os.path.getsize(path)
+        response = send_file(_WorkdirFile(path, workdir), as_attachment=True, download_name=download_name)
+    except Exception:
+        remove_workdir(workdir)
+        raise
+    response.content_length = size
+    return response
@@ -0,0 +1,88 @@
+import colorsys
+import math
+import re
+from functools import lru_cache
+import webcolors
+
+COLOR_CACHE_SIZE = 1024
+
+_COLOR_FUNCTION = re.compile(r'^(rgba?|hsla?)\(([^)]*)\)$')
+_ARGUMENT_SEPARATOR = re.compile(r'[\s,/]+')
+_HUE_UNITS = {'deg': 1 / 360, 'grad': 1 / 400, 'rad': 1 / (2 * math.pi), 'turn': 1}
+_TRANSPARENT = {'transparent', 'none', 'inherit', 'initial', 'unset', 'currentcolor'}
+
+
+def _parse_number(value, percent_scale):
+    if value.endswith('%'):
+        return float(value[:-1]) * percent_scale / 100
+    return float(value)
+
+
+def _parse_alpha(value):
+    return min(max(_parse_number(value, 1), 0.0), 1.0)
+
+
+def _parse_hue(value):
+    for unit, turns in _HUE_UNITS.items():
+        if value.endswith(unit):
+            return (float(value[:-len(unit)]) * turns) % 1
+    return (float(value) / 360) % 1
+
+
+def _parse_function(name, body):
+    args = [arg for arg in _ARGUMENT_SEPARATOR.split(body.strip()) if arg]
+    if len(args) not in (3, 4):
+        raise ValueError(f"Expected 3 or 4 arguments in {name}()")
+    alpha = _parse_alpha(args[3]) if len(args) == 4 else 1.0
+
+    if name.startswith('rgb'):
+        red, green, blue = (min(max(_parse_number(arg, 255), 0.0), 255.0) for arg in args[:3])
+    else:
+        hue = _parse_hue(args[0])
+        saturation, lightness = (min(max(float(arg.rstrip('%')) / 100, 0.0), 1.0) for arg in args[1:3])
+        red, green, blue = (channel * 255 for channel in colorsys.hls_to_rgb(hue, lightness, saturation))
+    return red, green, blue, alpha
+
+
+def _parse_hex(hex_val):
+    if len(hex_val) in (3, 4):
+        hex_val = "".join([c*2 for c in hex_val])
+    if len(hex_val) not in (6, 8):
+        raise ValueError(f"Invalid hex colour #{hex_val}")
+    channels = [int(hex_val[i:i + 2], 16) for i in range(0, len(hex_val), 2)]
+    alpha = channels[3] / 255 if len(channels) == 4 else 1.0
+    return channels[0], channels[1], channels[2], alpha
+
+
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
+def html_color_to_openpyxl_argb(html_color):
+    """Resolve a CSS colour to an opaque openpyxl ARGB string, or None.
+
+    Accepts hex (#rgb, #rgba, #rrggbb, #rrggbbaa), named colours, rgb()/rgba() and
+    hsl()/hsla() in comma or space syntax. Excel ignores the alpha byte, so
+    translucent colours are blended over the white sheet background instead, and
+    fully transparent ones resolve to None. Hit/miss counters are available from
+    html_color_to_openpyxl_argb.cache_info().
+    """
+    if not html_color:
+        return None
+
+    html_color = html_color.lower().replace('!important', '').strip()
+    if html_color in _TRANSPARENT:
+        return None
+
+    try:
+        function = _COLOR_FUNCTION.match(html_color)
+        if function:
+            red, green, blue, alpha = _parse_function(function.group(1), function.group(2))
+        elif html_color.startswith('#'):
+            red, green, blue, alpha = _parse_hex(html_color.lstrip('#'))
+        else:
+            red, green, blue, alpha = _parse_hex(webcolors.name_to_hex(html_color).lstrip('#'))
+    except ValueError:
+        return None
+
+    if alpha <= 0:
+        return None
+    channels = (round(channel * alpha + 255 * (1 - alpha)) for channel in (red, green, blue))
+    return 'FF' + ''.join(f'{channel:02X}' for channel in channels)
@@ -0,0 +1,191 @@
+import codecs
+import io
+import mmap
+import os
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+
+CHUNK_SIZE = 256 * 1024
+
+_TABLE_TAG = re.compile(rb'<(/?)table\b[^>]*>', re.IGNORECASE)
+
+HtmlCell = namedtuple('HtmlCell', ['tag', 'text', 'style', 'bgcolor', 'colspan', 'rowspan', 'bold'])
+HtmlRow = namedtuple('HtmlRow', ['table', 'style', 'cells'])
+
+
+class TableStreamParser(HTMLParser):
+    """Event-driven <table> extractor that only keeps the row currently being parsed.
+
+    Completed rows and <col> tags are queued as events and handed out by drain(),
+    so callers can feed the document in chunks and consume rows as they close.
+    Text is collected the way BeautifulSoup's get_text(strip=True) does it: each
+    text node is stripped and the non-empty pieces are joined.
+    """
+
+    def __init__(self, rows=True):
+        super().__init__(convert_charrefs=True)
+        self.rows = rows
+        self.table_count = 0
+        self._events = []
+        self._tables = []
+        self._row = None
+        self._cell = None
+        self._text = []
+        self._skip_depth = 0
+
+    def drain(self):
+        events, self._events = self._events, []
+        return events
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag in ('script', 'style'):
+            self._skip_depth += 1
+            return
+        if tag == 'table':
+            self._tables.append(self.table_count)
+            self.table_count += 1
+            return
+        if not self._tables:
+            return
+
+        attrs = {name: value or '' for name, value in attrs}
+        if tag == 'col':
+            self._events.append(('col', self._tables[-1], attrs.get('style', '')))
+        elif not self.rows:
+            return
+        elif tag == 'tr':
+            self._close_row()
+            self._row = (self._tables[-1], attrs.get('style', ''), [])
+        elif tag in ('td', 'th') and self._row is not None:
+            self._close_cell()
+            self._cell = {
+                'tag': tag,
+                'text': [],
+                'style': attrs.get('style', ''),
+                'bgcolor': attrs.get('bgcolor'),
+                'colspan': attrs.get('colspan') or 1,
+                'rowspan': attrs.get('rowspan') or 1,
+                'bold': False,
+            }
+        elif tag == 'b' and self._cell is not None:
+            self._cell['bold'] = True
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag in ('script', 'style'):
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in ('td', 'th'):
+            self._close_cell()
+        elif tag == 'tr':
+            self._close_row()
+        elif tag == 'table' and self._tables:
+            self._close_row()
+            self._tables.pop()
+
+    def handle_data(self, data):
+        if self._cell is not None and not self._skip_depth:
+            self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        self._close_row()
+
+    def _flush_text(self):
+        if self._text:
+            text = ''.join(self._text).strip()
+            if text:
+                self._cell['text'].append(text)
+            self._text = []
+
+    def _close_cell(self):
+        if self._cell is not None:
+            cell = self._cell
+            self._row[2].append(HtmlCell(
+                tag=cell['tag'],
+                text=''.join(cell['text']),
+                style=cell['style'],
+                bgcolor=cell['bgcolor'],
+                colspan=int(cell['colspan']),
+                rowspan=int(cell['rowspan']),
+                bold=cell['bold'],
+            ))
+            self._cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        if self._row is not None:
+            self._events.append(('row', HtmlRow(*self._row)))
+            self._row = None
+
+
+def _feed_file(parser, input_file, chunk_size, byte_range=None):
+    """Feed the file, or the (start, end) byte slice of it, to parser and yield its events as they arrive"""
+    start, end = byte_range or (0, None)
+    # Decoded the way open(input_file, 'r', encoding='utf-8') would, newline translation included
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            parser.feed(decoder.decode(chunk))
+            yield from parser.drain()
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from parser.drain()
+
+
+def split_tables(input_file):
+    """(start, end) byte offsets of every top-level <table> element, in document order.
+
+    A regex scan over the memory-mapped file rather than a parse, so it is cheap
+    enough to run before handing tables to separate workers. Nested tables stay
+    inside their outer table's range. Table tags inside comments are not told
+    apart from real ones.
+    """
+    ranges = []
+    if os.path.getsize(input_file) == 0:
+        return ranges
+    with open(input_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        depth = 0
+        start = None
+        for match in _TABLE_TAG.finditer(data):
+            if not match.group(1):
+                if depth == 0:
+                    start = match.start()
+                depth += 1
+            elif depth:
+                depth -= 1
+                if depth == 0:
+                    ranges.append((start, match.end()))
+        if depth:
+            ranges.append((start, len(data)))
+    return ranges
+
+
+def scan_table_columns(input_file, chunk_size=CHUNK_SIZE, byte_range=None):
+    """Return the <col> style strings of every table in document order ([] when there are no tables)"""
+    parser = TableStreamParser(rows=False)
+    columns = []
+    for _, table, style in _feed_file(parser, input_file, chunk_size, byte_range):
+        columns.extend([] for _ in range(table + 1 - len(columns)))
+        columns[table].append(style)
+    columns.extend([] for _ in range(parser.table_count - len(columns)))
+    return columns
+
+
+def iter_table_rows(input_file, chunk_size=CHUNK_SIZE, byte_range=None):
+    """Yield every <tr> as an HtmlRow while reading the file (or a byte_range of it) in chunks"""
+    for kind, *payload in _feed_file(TableStreamParser(), input_file, chunk_size, byte_range):
+        if kind == 'row':
+            yield payload[0]
@@ -0,0 +1,427 @@
+import math
+import multiprocessing
+import os
+import pickle
+import re
+import logging
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from functools import lru_cache, partial
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment
+from openpyxl.styles.borders import Border, Side
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+from html_colors import html_color_to_openpyxl_argb
+from html_tables import iter_table_rows, scan_table_columns, split_tables
+from sheet_layout import POINTS_PER_LINE, LayoutEstimator, layout_column_widths, sheet_column_widths
+from xlsx_reader import iter_row_chunks
+
+logger = logging.getLogger(__name__)
+
+PIXELS_TO_EXCEL_UNITS = 8.43
+# Worker processes building sheets in sheet-per-table mode; smaller inputs, and conversions already
+# running in a pool worker, are built in-process
+SHEET_WORKERS = int(os.environ.get('EXCEL_SHEET_WORKERS', os.cpu_count() or 1))
+PARALLEL_SHEETS_MIN_BYTES = 1024 * 1024
+STYLE_CACHE_SIZE = 4096
+
+ALIGN_MAP = {'center': 'center', 'left': 'left', 'right': 'right', 'justify': 'justify'}
+BOLD_WEIGHTS = {'bold', 'bolder', '600', '700', '800', '900'}
+
+_STYLE_DECLARATION = re.compile(r'(background-color|text-align|font-weight|(?<!background-)color):\s*([^;]+)')
+_COL_WIDTH = re.compile(r'width:\s*(\d+)')
+
+
+class LayoutCell(namedtuple('LayoutCell', ['column', 'colspan', 'text', 'bold', 'font_color', 'fill_color', 'horizontal'])):
+    """One HTML cell placed on the master column grid, with its resolved formatting"""
+    __slots__ = ()
+
+    def style_key(self):
+        return {'bold': self.bold, 'font_color': self.font_color, 'fill_color': self.fill_color, 'horizontal': self.horizontal}
+
+
+class InlineStyle(namedtuple('InlineStyle', ['background', 'color', 'text_align', 'font_weight'])):
+    """The cell-relevant declarations of an inline style attribute; None where a property is absent"""
+    __slots__ = ()
+
+    def merged(self, fallback):
+        """Fill the properties this style leaves unset from fallback (e.g. the enclosing <tr>)"""
+        if not any(fallback):
+            return self
+        return InlineStyle(*(own if own is not None else inherited for own, inherited in zip(self, fallback)))
+
+    @property
+    def horizontal(self):
+        return ALIGN_MAP.get(self.text_align, 'general')
+
+    @property
+    def bold(self):
+        return self.font_weight in BOLD_WEIGHTS
+
+
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def parse_inline_style(style):
+    """Single pass over a style attribute; the first declaration of each property wins"""
+    found = {}
+    for match in _STYLE_DECLARATION.finditer(style):
+        found.setdefault(match.group(1), match.group(2).strip())
+    text_align = found.get('text-align')
+    font_weight = found.get('font-weight')
+    return InlineStyle(
+        background=found.get('background-color'),
+        color=found.get('color'),
+        text_align=text_align.lower() if text_align else None,
+        font_weight=font_weight.lower() if font_weight else None,
+    )
+
+
+class StyleRegistry:
+    """Interns cell formats so each distinct style is built and registered with the workbook once"""
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        thin_black_side = Side(style='thin', color='FF000000')
+        self.default_border = Border(left=thin_black_side, right=thin_black_side, top=thin_black_side, bottom=thin_black_side)
+        self._border_id = workbook._borders.add(self.default_border)
+        self._border_only = StyleArray()
+        self._border_only.borderId = self._border_id
+        self._styles = {}
+
+    def __len__(self):
+        return len(self._styles)
+
+    def get(self, bold=False, font_color=None, fill_color=None, horizontal='general', bordered=True):
+        key = (bold, font_color, fill_color, horizontal, bordered)
+        style = self._styles.get(key)
+        if style is None:
+            style = self._styles[key] = self._register(*key)
+        return style
+
+    def _register(self, bold, font_color, fill_color, horizontal, bordered):
+        font = Font(bold=bold)
+        if font_color:
+            try: font.color = font_color
+            except ValueError: pass
+        fill = None
+        if fill_color:
+            try: fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+            except ValueError: fill = None
+        alignment = Alignment(horizontal=horizontal, vertical='center', wrap_text=True)
+
+        style = StyleArray()
+        style.fontId = self.workbook._fonts.add(font)
+        if fill:
+            style.fillId = self.workbook._fills.add(fill)
+        style.alignmentId = self.workbook._alignments.add(alignment)
+        if bordered:
+            style.borderId = self._border_id
+        return style
+
+    def apply(self, cell, **key):
+        cell._style = copy(self.get(**key))
+
+    def apply_border(self, cell):
+        cell._style = copy(self._border_only)
+
+
+def cell_line_count(text, width_units):
+    lines_from_newlines = text.count('\n') + 1
+    lines_from_wrapping = 1
+    if width_units > 0:
+        lines_from_wrapping = math.ceil(len(text) / (width_units / 1.1))
+    return max(lines_from_newlines, lines_from_wrapping)
+
+
+def column_width_lookup(worksheet):
+    column_widths = {}
+
+    def column_width(col_idx):
+        width = column_widths.get(col_idx)
+        if width is None:
+            width = worksheet.column_dimensions[get_column_letter(col_idx)].width
+            column_widths[col_idx] = width
+        return width
+
+    return column_width
+
+
+def _col_pixels(col_styles):
+    pixels = []
+    for style in col_styles:
+        match = _COL_WIDTH.search(style)
+        if match:
+            pixels.append(int(match.group(1)))
+    return pixels
+
+
+def _master_layout(table_columns):
+    master_layout_pixels = []
+    max_cols = 0
+    for col_styles in table_columns:
+        if len(col_styles) > max_cols:
+            max_cols = len(col_styles)
+            master_layout_pixels = _col_pixels(col_styles)
+    return master_layout_pixels
+
+
+def _layout_rows(html_rows, table_columns, master_layout_pixels):
+    """Yield (excel row, [LayoutCell, ...]) for every HtmlRow, leaving a blank row after each table"""
+    local_layouts = [_col_pixels(col_styles) for col_styles in table_columns]
+    rows_written = 0
+    for row in html_rows:
+        local_layout_pixels = local_layouts[row.table]
+        row_style = parse_inline_style(row.style)
+        current_col_excel = 1
+        layout_cells = []
+
+        for cell_idx, cell in enumerate(row.cells):
+            style = parse_inline_style(cell.style).merged(row_style)
+            bg_color_html = cell.bgcolor or style.background
+            font_color_html = style.color
+            text_align = style.horizontal
+            is_bold = style.bold or cell.bold or cell.tag == 'th'
+
+            html_colspan = cell.colspan
+
+            target_pixel_width = 0
+            if local_layout_pixels and cell_idx < len(local_layout_pixels):
+                for i in range(html_colspan):
+                    if (cell_idx + i) < len(local_layout_pixels):
+                        target_pixel_width += local_layout_pixels[cell_idx + i]
+
+            excel_colspan = 0
+            covered_width = 0
+            if target_pixel_width > 0:
+                start_master_col_idx = current_col_excel - 1
+                while covered_width < (target_pixel_width * 0.9) and (start_master_col_idx + excel_colspan) < len(master_layout_pixels):
+                    covered_width += master_layout_pixels[start_master_col_idx + excel_colspan]
+                    excel_colspan += 1
+            excel_colspan = max(1, excel_colspan)
+
+            layout_cells.append(LayoutCell(
+                column=current_col_excel,
+                colspan=excel_colspan,
+                text=cell.text,
+                bold=bool(is_bold),
+                font_color=html_color_to_openpyxl_argb(font_color_html),
+                fill_color=html_color_to_openpyxl_argb(bg_color_html),
+                horizontal=text_align,
+            ))
+            current_col_excel += excel_colspan
+
+        # Every table that started before this row is followed by one blank separator row
+        yield rows_written + row.table + 1, layout_cells
+        rows_written += 1
+
+
+def _write_rows(workbook, rows, master_layout_excel_units):
+    worksheet = workbook.active
+    styles = StyleRegistry(workbook)
+    for i, width in enumerate(master_layout_excel_units):
+        worksheet.column_dimensions[get_column_letter(i + 1)].width = width
+
+    # Text metrics are recorded as cells are written; every row is sized in one vectorized pass at the end
+    layout = LayoutEstimator()
+    for row_idx, layout_cells in rows:
+        for layout_cell in layout_cells:
+            target_cell = worksheet.cell(row=row_idx, column=layout_cell.column)
+            target_cell.value = layout_cell.text
+            layout.add(row_idx, layout_cell.column, layout_cell.text, layout_cell.colspan)
+
+            if layout_cell.colspan > 1:
+                end_col = layout_cell.column + layout_cell.colspan - 1
+                worksheet.merge_cells(start_row=row_idx, start_column=layout_cell.column, end_row=row_idx, end_column=end_col)
+                for col_idx in range(layout_cell.column + 1, end_col + 1):
+                    styles.apply_border(worksheet.cell(row=row_idx, column=col_idx))
+
+            # Styled after merging so merge_cells has no anchor border to copy onto the range edges
+            styles.apply(target_cell, **layout_cell.style_key())
+
+    layout.apply_row_heights(worksheet, sheet_column_widths(worksheet, layout.max_column))
+
+
+def _write_rows_streaming(workbook, rows, master_layout_excel_units):
+    """Append rows to a write-only sheet, so only the row being emitted is held in memory"""
+    worksheet = workbook.create_sheet()
+    _stream_rows(worksheet, StyleRegistry(workbook), rows, master_layout_excel_units)
+
+
+def _stream_rows(worksheet, styles, rows, layout_excel_units, row_heights=None):
+    """Append rows to a write-only worksheet; row heights are computed per row unless row_heights gives them by row number"""
+    # Column widths must be in place before the first row is streamed out
+    for i, width in enumerate(layout_excel_units):
+        worksheet.column_dimensions[get_column_letter(i + 1)].width = width
+    column_width = column_width_lookup(worksheet)
+
+    def emit(row_idx, values, max_lines_in_row):
+        worksheet.row_dimensions[row_idx].height = max_lines_in_row * POINTS_PER_LINE
+        worksheet.append(values)
+        # The dimension has been written with the row; don't keep one per row alive
+        del worksheet.row_dimensions[row_idx]
+
+    next_row = 1
+    for row_idx, layout_cells in rows:
+        while next_row < row_idx:
+            emit(next_row, [], 1)
+            next_row += 1
+
+        values = []
+        max_lines_in_row = 1
+        for layout_cell in layout_cells:
+            values.extend([None] * (layout_cell.column - 1 - len(values)))
+            target_cell = WriteOnlyCell(worksheet, value=layout_cell.text)
+            target_cell._style = copy(styles.get(**layout_cell.style_key()))
+            values.append(target_cell)
+
+            effective_width_units = column_width(layout_cell.column)
+            if layout_cell.colspan > 1:
+                end_col = layout_cell.column + layout_cell.colspan - 1
+                worksheet.merged_cells.ranges.add(CellRange(min_col=layout_cell.column, min_row=row_idx, max_col=end_col, max_row=row_idx))
+                effective_width_units = sum(column_width(c) for c in range(layout_cell.column, end_col + 1))
+                for _ in range(layout_cell.colspan - 1):
+                    border_cell = WriteOnlyCell(worksheet)
+                    styles.apply_border(border_cell)
+                    values.append(border_cell)
+
+            if layout_cell.text and row_heights is None:
+                max_lines_in_row = max(max_lines_in_row, cell_line_count(layout_cell.text, effective_width_units))
+
+        if row_heights is not None:
+            max_lines_in_row = row_heights[row_idx] / POINTS_PER_LINE
+        emit(row_idx, values, max_lines_in_row)
+        next_row = row_idx + 1
+
+
+SheetPart = namedtuple('SheetPart', ['spool', 'layout_excel_units', 'row_heights'])
+
+
+def build_table_sheet(input_file, byte_range, spool_path):
+    """Lay out one top-level table as a sheet of its own; runs in a worker process.
+
+    The table is parsed from its byte range only, with its own <col> layout,
+    and the finished rows are pickled to spool_path in chunks. Row heights are
+    sized in one vectorized pass before returning, so the process assembling
+    the workbook only has to append cells.
+    """
+    table_columns = scan_table_columns(input_file, byte_range=byte_range)
+    layout_pixels = _col_pixels(table_columns[0]) if table_columns else []
+    layout_excel_units = [px / PIXELS_TO_EXCEL_UNITS for px in layout_pixels]
+    rows = _layout_rows(iter_table_rows(input_file, byte_range=byte_range), table_columns, layout_pixels)
+
+    layout = LayoutEstimator()
+    max_row = 0
+    with open(spool_path, 'wb') as spool:
+        for chunk in iter_row_chunks(rows):
+            for row_idx, layout_cells in chunk:
+                for layout_cell in layout_cells:
+                    layout.add(row_idx, layout_cell.column, layout_cell.text, layout_cell.colspan)
+            max_row = chunk[-1][0]
+            pickle.dump(chunk, spool, protocol=pickle.HIGHEST_PROTOCOL)
+
+    lines = layout.row_lines(layout_column_widths(layout_excel_units, layout.max_column), max_row)
+    return SheetPart(spool_path, layout_excel_units, (lines * POINTS_PER_LINE).tolist())
+
+
+def _read_spool(spool_path):
+    with open(spool_path, 'rb') as spool:
+        while True:
+            try:
+                yield from pickle.load(spool)
+            except EOFError:
+                return
+
+
+def sheet_worker_count():
+    """SHEET_WORKERS for a top-level process; 1 inside a worker process, whose pool already fills the CPUs"""
+    return SHEET_WORKERS if multiprocessing.parent_process() is None else 1
+
+
+def _write_table_sheets(input_file, output_file, table_ranges, max_workers):
+    """One worksheet per top-level table, laid out in parallel and appended to a write-only workbook in order"""
+    workbook = Workbook(write_only=True)
+    styles = StyleRegistry(workbook)
+    parallel = (max_workers > 1 and len(table_ranges) > 1
+                and os.path.getsize(input_file) >= PARALLEL_SHEETS_MIN_BYTES)
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as spool_dir:
+        spools = [os.path.join(spool_dir, f'table{index}.pickle') for index in range(len(table_ranges))]
+        if parallel:
+            executor = ProcessPoolExecutor(max_workers=min(max_workers, len(table_ranges)),
+                                           mp_context=multiprocessing.get_context('spawn'))
+            parts = [executor.submit(build_table_sheet, input_file, byte_range, spool).result
+                     for byte_range, spool in zip(table_ranges, spools)]
+        else:
+            executor = None
+            parts = [partial(build_table_sheet, input_file, byte_range, spool)
+                     for byte_range, spool in zip(table_ranges, spools)]
+        try:
+            # Sheets are appended in document order while later tables are still being built
+            for index, part in enumerate(parts, start=1):
+                part = part()
+                worksheet = workbook.create_sheet(f'Table {index}')
+                _stream_rows(worksheet, styles, _read_spool(part.spool), part.layout_excel_units, part.row_heights)
+                os.remove(part.spool)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        workbook.save(output_file)
+    logger.debug(f"Wrote {len(table_ranges)} table sheets ({'parallel' if parallel else 'in-process'})")
+
+
+def convert_to_excel(input_file, output_file, write_only=False, sheet_per_table=False, max_workers=None):
+    """Convert the tables in an HTML file to a styled worksheet.
+
+    The file is read twice in chunks: once for the <col> layout of every table,
+    then row by row while cells are written. write_only streams rows into an
+    openpyxl write-only workbook instead of building the whole sheet in memory;
+    use it for very large documents.
+
+    sheet_per_table gives every top-level table a worksheet of its own with its
+    own column layout instead of stacking them on one sheet against a shared
+    master layout. The sheets are built by up to max_workers processes
+    (sheet_worker_count() by default) and are always streamed, so write_only
+    does not apply.
+    """
+    if sheet_per_table:
+        table_ranges = split_tables(input_file)
+        if table_ranges:
+            _write_table_sheets(input_file, output_file, table_ranges, max_workers or sheet_worker_count())
+            return
+        table_columns = []
+    else:
+        table_columns = scan_table_columns(input_file)
+
+    if not table_columns:
+        import pandas as pd
+        from bs4 import BeautifulSoup
+        with open(input_file, 'r', encoding='utf-8') as f:
+            soup = BeautifulSoup(f.read(), 'html.parser')
+        text = soup.get_text(separator='\n', strip=True)
+        df = pd.DataFrame([line for line in text.split('\n') if line], columns=['Content'])
+        df.to_excel(output_file, index=False)
+        return
+
+    master_layout_pixels = _master_layout(table_columns)
+    if not master_layout_pixels:
+        logger.error("Could not determine a master layout from <colgroup> tags.")
+        import pandas as pd
+        with open(input_file, 'r', encoding='utf-8') as f:
+            pd.read_html(f.read()).to_excel(output_file, index=False)
+        return
+
+    master_layout_excel_units = [px / PIXELS_TO_EXCEL_UNITS for px in master_layout_pixels]
+    rows = _layout_rows(iter_table_rows(input_file), table_columns, master_layout_pixels)
+
+    workbook = Workbook(write_only=write_only)
+    if write_only:
+        _write_rows_streaming(workbook, rows, master_layout_excel_units)
+    else:
+        _write_rows(workbook, rows, master_layout_excel_units)
+
+    workbook.save(output_file)
+    logger.debug(f"Style cache: {parse_inline_style.cache_info()}, colour cache: {html_color_to_openpyxl_argb.cache_info()}")
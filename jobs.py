@@ -0,0 +1,165 @@
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from converters import cache_parts, convert_file
+from downloads import remove_workdir
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """One submitted upload: its working directory, its conversions and their outcomes"""
+
+    def __init__(self, workdir, conversions, compression_level):
+        self.id = uuid.uuid4().hex
+        self.workdir = workdir
+        self.conversions = conversions
+        self.compression_level = compression_level
+        self.status = QUEUED
+        self.outputs = []
+        self.failures = []
+        self.futures = []
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def completed(self):
+        return len(self.outputs) + len(self.failures)
+
+    def to_dict(self):
+        status = self.status
+        if status == QUEUED and (self.completed or any(future.running() for future in self.futures)):
+            status = RUNNING
+        return {
+            'id': self.id,
+            'status': status,
+            'total': len(self.conversions),
+            'completed': self.completed,
+            'progress': self.completed / len(self.conversions) if self.conversions else 1.0,
+            'outputs': [os.path.basename(path) for path in self.outputs],
+            'failures': self.failures,
+            'created': self.created,
+            'finished': self.finished,
+        }
+
+
+class JobManager:
+    """In-process job store that runs conversions on a BatchConverter's pool.
+
+    At most max_pending jobs may be unfinished at once; submit raises QueueFull
+    beyond that. Finished jobs, and their working directories, are kept for
+    result_ttl seconds so results can be fetched, then dropped.
+    """
+
+    def __init__(self, batch_converter, cache=None, max_pending=16, result_ttl=60 * 60):
+        self.batch_converter = batch_converter
+        self.cache = cache
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def full(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.finished is None) >= self.max_pending
+
+    def submit(self, workdir, conversions, compression_level=0):
+        self.expire()
+        job = Job(workdir, conversions, compression_level)
+        with self._lock:
+            if sum(1 for pending in self._jobs.values() if pending.finished is None) >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs are already queued or running")
+            self._jobs[job.id] = job
+
+        for conversion in conversions:
+            key = None
+            if self.cache is not None:
+                key = self.cache.key(conversion.input_file, *cache_parts(conversion))
+                if self.cache.fetch(key, conversion.output_file):
+                    self._record(job, conversion, conversion.output_file, None)
+                    continue
+            future = self.batch_converter.executor.submit(convert_file, conversion)
+            job.futures.append(future)
+            future.add_done_callback(partial(self._on_done, job, conversion, key))
+        return job
+
+    def get(self, job_id):
+        self.expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job's queued conversions; ones already running finish but are discarded"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            if job.finished is not None:
+                return job
+            job.status = CANCELLED
+            job.finished = time.time()
+        for future in job.futures:
+            future.cancel()
+        if not any(future.running() for future in job.futures):
+            remove_workdir(job.workdir)
+        return job
+
+    def expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished is not None and now - job.finished > self.result_ttl]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            if os.path.isdir(job.workdir):
+                remove_workdir(job.workdir)
+
+    def shutdown(self):
+        # Job results only live as long as this process, so don't leave their directories behind
+        with self._lock:
+            jobs, self._jobs = list(self._jobs.values()), {}
+        for job in jobs:
+            for future in job.futures:
+                future.cancel()
+            if os.path.isdir(job.workdir):
+                remove_workdir(job.workdir)
+
+    def _on_done(self, job, conversion, key, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self.batch_converter.discard_executor()
+        if error is None and key is not None and job.status != CANCELLED:
+            self.cache.store(key, conversion.output_file)
+        self._record(job, conversion, None if error else future.result(), error)
+
+    def _record(self, job, conversion, output_file, error):
+        with self._lock:
+            if job.status == CANCELLED:
+                return
+            if error is None:
+                job.outputs.append(output_file)
+            else:
+                logger.error(f"Job {job.id}: error converting {conversion.name}: {error}")
+                job.failures.append(f'{conversion.name}: {error}')
+            if job.completed == len(job.conversions):
+                job.status = DONE if job.outputs else FAILED
+                job.finished = time.time()
@@ -0,0 +1,364 @@
+import logging
+import os
+import queue
+import shutil
+import signal
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+OFFICE_POOL_SIZE = int(os.environ.get('OFFICE_POOL_SIZE', 1))
+OFFICE_MAX_JOBS = int(os.environ.get('OFFICE_MAX_JOBS', 50))  # recycle an application after this many files
+OFFICE_JOB_TIMEOUT = float(os.environ.get('OFFICE_JOB_TIMEOUT', 300))  # seconds before a conversion counts as hung
+OFFICE_QUEUE_SIZE = int(os.environ.get('OFFICE_QUEUE_SIZE', 100))
+
+WD_FORMAT_PDF = 17
+XL_TYPE_PDF = 0
+XL_LANDSCAPE = 2
+
+
+class PoolBusy(Exception):
+    pass
+
+
+class OfficeWorker:
+    """One long-lived Office application, driven from a single thread.
+
+    The pool calls every method from the worker's own thread, so the COM
+    objects never cross apartments. Subclasses implement launch, convert_file
+    and healthy; the base class handles the apartment and the process id.
+    """
+
+    name = 'office'
+    image_name = None  # executable of the application, for finding its process
+    # Launches are serialised so a new process can be told apart from another worker's
+    _launch_lock = threading.Lock()
+
+    def __init__(self):
+        self.application = None
+        self.pid = None
+        self.jobs = 0
+        self.retired = False
+        self.current = None
+
+    def initialize(self):
+        import pythoncom
+        pythoncom.CoInitialize()
+
+    def uninitialize(self):
+        import pythoncom
+        pythoncom.CoUninitialize()
+
+    def start(self):
+        with OfficeWorker._launch_lock:
+            before = self.running_pids()
+            self.application = self.launch()
+            self.pid = self.application_pid(before)
+        self.jobs = 0
+        logger.info(f"Started {self.name} worker (pid {self.pid})")
+
+    def stop(self):
+        if self.application is None:
+            return
+        try:
+            self.application.Quit()
+        except Exception as e:
+            logger.error(f"Error quitting {self.name}: {e}")
+        self.application = None
+        self.pid = None
+
+    def kill(self):
+        """Terminate a hung application from outside its thread"""
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError as e:
+                logger.error(f"Could not terminate {self.name} process {self.pid}: {e}")
+        else:
+            logger.error(f"No process id for hung {self.name} worker; abandoning it, its process is leaked")
+
+    def application_pid(self, before=frozenset()):
+        """Process id of the launched application, from its main window or else as the one new process.
+
+        before is running_pids() from just ahead of the launch. Word exposes no
+        Hwnd, so for it the process list diff is what finds the pid.
+        """
+        hwnd = getattr(self.application, 'Hwnd', None)
+        if hwnd:
+            import win32process
+            return win32process.GetWindowThreadProcessId(hwnd)[1]
+        started = self.running_pids() - before
+        if len(started) == 1:
+            return started.pop()
+        logger.error(f"Could not find the process of the new {self.name} instance ({len(started)} new "
+                     f"{self.image_name} processes); if it hangs it can't be terminated and will be leaked")
+        return None
+
+    def running_pids(self):
+        """Ids of the running processes of image_name"""
+        if self.image_name is None:
+            return set()
+        import pywintypes
+        import win32api
+        import win32con
+        import win32process
+        pids = set()
+        for pid in win32process.EnumProcesses():
+            try:
+                handle = win32api.OpenProcess(win32con.PROCESS_QUERY_INFORMATION | win32con.PROCESS_VM_READ,
+                                              False, pid)
+            except pywintypes.error:
+                continue  # system processes and other users' processes
+            try:
+                if os.path.basename(win32process.GetModuleFileNameEx(handle, 0)).lower() == self.image_name:
+                    pids.add(pid)
+            except pywintypes.error:
+                pass
+            finally:
+                win32api.CloseHandle(handle)
+        return pids
+
+    def healthy(self):
+        try:
+            self.application.Version
+            return True
+        except Exception:
+            return False
+
+    def launch(self):
+        raise NotImplementedError
+
+    def convert_file(self, input_file, output_file):
+        raise NotImplementedError
+
+
+class ExcelWorker(OfficeWorker):
+    name = 'Excel'
+    image_name = 'excel.exe'
+
+    def launch(self):
+        import win32com.client as win32
+        excel = win32.DispatchEx('Excel.Application')
+        excel.Visible = False
+        excel.DisplayAlerts = False
+        return excel
+
+    def convert_file(self, input_file, output_file):
+        excel = self.application
+        wb = excel.Workbooks.Open(os.path.abspath(input_file))
+        try:
+            for sheet in wb.Sheets:
+                page_setup = sheet.PageSetup
+                page_setup.Zoom = False
+                page_setup.FitToPagesWide = 1
+                page_setup.FitToPagesTall = False
+                page_setup.Orientation = XL_LANDSCAPE
+                page_setup.TopMargin = excel.InchesToPoints(0.25)
+                page_setup.BottomMargin = excel.InchesToPoints(0)
+                page_setup.LeftMargin = excel.InchesToPoints(0)
+                page_setup.RightMargin = excel.InchesToPoints(0)
+                page_setup.HeaderMargin = excel.InchesToPoints(0.25)
+                page_setup.FooterMargin = excel.InchesToPoints(0.25)
+
+            wb.ExportAsFixedFormat(XL_TYPE_PDF, os.path.abspath(output_file), 0)
+        finally:
+            wb.Close(False)
+
+
+class WordWorker(OfficeWorker):
+    name = 'Word'
+    image_name = 'winword.exe'
+
+    def launch(self):
+        import win32com.client as win32
+        word = win32.DispatchEx('Word.Application')
+        word.Visible = False
+        word.DisplayAlerts = 0
+        return word
+
+    def convert_file(self, input_file, output_file):
+        doc = self.application.Documents.Open(os.path.abspath(input_file), ReadOnly=True)
+        try:
+            doc.SaveAs(os.path.abspath(output_file), FileFormat=WD_FORMAT_PDF)
+        finally:
+            doc.Close(0)
+
+
+class FakeWorker(OfficeWorker):
+    """Stand-in without COM for exercising the pool: copies input to output after delay seconds.
+
+    convert_file blocks until release() when hang is set, and raises when
+    fail is set, so recycling, hang detection and error paths can be driven.
+    """
+
+    name = 'fake'
+
+    def __init__(self, delay=0.0, hang=False, fail=False):
+        super().__init__()
+        self.delay = delay
+        self.hang = hang
+        self.fail = fail
+        self.launches = 0
+        self._released = threading.Event()
+
+    def initialize(self):
+        pass
+
+    def uninitialize(self):
+        pass
+
+    def launch(self):
+        self.launches += 1
+        return object()
+
+    def application_pid(self, before=frozenset()):
+        return None
+
+    def stop(self):
+        self.application = None
+
+    def kill(self):
+        self._released.set()
+
+    def release(self):
+        self._released.set()
+
+    def healthy(self):
+        return True
+
+    def convert_file(self, input_file, output_file):
+        if self.hang:
+            self._released.wait()
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"Fake conversion of {input_file} failed")
+        shutil.copyfile(input_file, output_file)
+
+
+class _Task:
+    __slots__ = ('input_file', 'output_file', 'future', 'started')
+
+    def __init__(self, input_file, output_file):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.future = Future()
+        self.started = None
+
+
+class OfficePool:
+    """A fixed number of long-lived Office workers behind one bounded queue.
+
+    Each worker owns a thread with its own COM apartment and one application
+    instance. Before a job the worker is health-checked and restarted after
+    max_jobs conversions; a failed conversion also gets a fresh instance. A
+    watchdog retires any worker whose job runs past job_timeout, terminates its
+    process and starts a replacement, failing that job with TimeoutError.
+    """
+
+    def __init__(self, worker_factory, size=OFFICE_POOL_SIZE, max_jobs=OFFICE_MAX_JOBS,
+                 job_timeout=OFFICE_JOB_TIMEOUT, queue_size=OFFICE_QUEUE_SIZE, check_interval=1.0):
+        self.worker_factory = worker_factory
+        self.max_jobs = max_jobs
+        self.job_timeout = job_timeout
+        self.check_interval = check_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        for _ in range(size):
+            self._spawn()
+        threading.Thread(target=self._watch, name='office-pool-watchdog', daemon=True).start()
+
+    def _spawn(self):
+        worker = self.worker_factory()
+        with self._lock:
+            self._workers.append(worker)
+        threading.Thread(target=self._run, args=(worker,), name=f'office-{worker.name}', daemon=True).start()
+        return worker
+
+    def _run(self, worker):
+        worker.initialize()
+        try:
+            while not worker.retired:
+                task = self._queue.get()
+                if task is None:
+                    break
+                if not task.future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    self._prepare(worker)
+                    task.started = time.monotonic()
+                    worker.current = task
+                    worker.convert_file(task.input_file, task.output_file)
+                    worker.jobs += 1
+                except Exception as e:
+                    logger.error(f"{worker.name} worker failed on {task.input_file}: {e}")
+                    if not task.future.done():
+                        task.future.set_exception(e)
+                    # Don't trust an instance that just failed; the next job gets a new one
+                    worker.stop()
+                else:
+                    if not task.future.done():
+                        task.future.set_result(task.output_file)
+                finally:
+                    worker.current = None
+        finally:
+            worker.stop()
+            worker.uninitialize()
+
+    def _prepare(self, worker):
+        if worker.application is not None and (worker.jobs >= self.max_jobs or not worker.healthy()):
+            logger.info(f"Recycling {worker.name} worker after {worker.jobs} jobs")
+            worker.stop()
+        if worker.application is None:
+            worker.start()
+
+    def _watch(self):
+        while not self._closed.wait(self.check_interval):
+            with self._lock:
+                workers = list(self._workers)
+            for worker in workers:
+                task = worker.current
+                if task is None or task.started is None or time.monotonic() - task.started <= self.job_timeout:
+                    continue
+                logger.error(f"{worker.name} worker hung on {task.input_file}; replacing it")
+                worker.retired = True
+                with self._lock:
+                    self._workers.remove(worker)
+                if not task.future.done():
+                    task.future.set_exception(TimeoutError(f"Conversion of {task.input_file} timed out"))
+                worker.kill()
+                self._spawn()
+
+    def submit(self, input_file, output_file, timeout=None):
+        """Queue a conversion and return its Future; raises PoolBusy if the queue stays full for timeout seconds"""
+        task = _Task(input_file, output_file)
+        try:
+            self._queue.put(task, timeout=timeout)
+        except queue.Full:
+            raise PoolBusy(f"Office conversion queue is full ({self._queue.maxsize} waiting)")
+        return task.future
+
+    def convert(self, input_file, output_file):
+        return self.submit(input_file, output_file, timeout=self.job_timeout).result()
+
+    def shutdown(self):
+        self._closed.set()
+        with self._lock:
+            workers = list(self._workers)
+        for _ in workers:
+            self._queue.put(None)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(worker_class):
+    """The process-wide pool for worker_class, started on first use"""
+    with _pools_lock:
+        if worker_class not in _pools:
+            _pools[worker_class] = OfficePool(worker_class)
+        return _pools[worker_class]
@@ -0,0 +1,103 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Optional print stylesheet applied to every document; parsed once per process
+BASE_STYLESHEET = os.environ.get('PDF_BASE_STYLESHEET') or None
+
+_WARMUP_HTML = '<html><body><p>warm-up</p></body></html>'
+
+# Per-process WeasyPrint state: module, font configuration and parsed base stylesheet
+_warm = {}
+_warm_lock = threading.Lock()
+
+
+def warm_up(base_stylesheet=BASE_STYLESHEET):
+    """Import WeasyPrint, load fontconfig and parse the base stylesheet once for this process.
+
+    Used as the initializer of worker pools, and lazily by write_pdf otherwise.
+    """
+    with _warm_lock:
+        if _warm:
+            return
+        try:
+            import weasyprint
+            from weasyprint.text.fonts import FontConfiguration
+        except (ImportError, OSError) as e:
+            # Remembered so the failure surfaces on the first render instead of at worker start-up
+            logger.warning(f"WeasyPrint is unavailable, PDF rendering will fail: {e}")
+            _warm['error'] = e
+            return
+
+        font_config = FontConfiguration()
+        stylesheets = []
+        if base_stylesheet:
+            stylesheets.append(weasyprint.CSS(filename=base_stylesheet, font_config=font_config))
+        # A throwaway render pulls in fontconfig/Pango and the user-agent stylesheets
+        weasyprint.HTML(string=_WARMUP_HTML).write_pdf(stylesheets=stylesheets, font_config=font_config)
+
+        _warm.update(weasyprint=weasyprint, font_config=font_config, stylesheets=stylesheets)
+        logger.debug(f"WeasyPrint warmed up in process {os.getpid()}")
+
+
+def write_pdf(output_file, string=None, filename=None):
+    """Render HTML from a string or file to output_file, reusing this process's warm state"""
+    if not _warm:
+        warm_up()
+    if 'error' in _warm:
+        raise _warm['error']
+    if filename is not None:
+        with open(filename, 'r', encoding='utf-8') as f:
+            string = f.read()
+    weasyprint = _warm['weasyprint']
+    weasyprint.HTML(string=string).write_pdf(
+        output_file,
+        stylesheets=_warm['stylesheets'],
+        font_config=_warm['font_config'],
+    )
+    return output_file
+
+
+class PdfRenderer:
+    """A small pool of pre-warmed WeasyPrint processes fed through the executor's call queue"""
+
+    def __init__(self, max_workers=None, base_stylesheet=BASE_STYLESHEET):
+        self.max_workers = max_workers or int(os.environ.get('PDF_RENDER_WORKERS', 2))
+        self.base_stylesheet = base_stylesheet
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting PDF renderer with {self.max_workers} workers")
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=warm_up,
+                    initargs=(self.base_stylesheet,),
+                )
+            return self._executor
+
+    def submit(self, output_file, string=None, filename=None):
+        return self.executor.submit(write_pdf, output_file, string=string, filename=filename)
+
+    def render(self, output_file, string=None, filename=None):
+        return self.submit(output_file, string=string, filename=filename).result()
+
+    def start(self):
+        """Spin every worker up front so the first requests don't pay for the warm-up"""
+        futures = [self.executor.submit(os.getpid) for _ in range(self.max_workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
@@ -0,0 +1,281 @@
+import copy
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+from pdf_renderer import PdfRenderer, write_pdf
+
+logger = logging.getLogger(__name__)
+
+# Documents at least this large are rendered in chunks; smaller ones go through one WeasyPrint call
+PDF_SPLIT_MIN_BYTES = int(os.environ.get('PDF_SPLIT_MIN_BYTES', 2 * 1024 * 1024))
+PDF_SPLIT_ROWS = int(os.environ.get('PDF_SPLIT_ROWS', 500))  # weight budget per chunk, roughly table rows
+# Chunk renderers for a top-level process; pool workers render their chunks themselves, one after another
+PDF_SPLIT_WORKERS = int(os.environ.get('PDF_SPLIT_WORKERS', os.cpu_count() or 1))
+
+# Containers that can be cut between their children, the pieces wrapped in copies of the container
+SPLITTABLE = {'body', 'div', 'section', 'article', 'main', 'blockquote', 'ul', 'ol', 'dl'}
+WEIGHED = './/tr|.//p|.//li|.//h1|.//h2|.//h3|.//h4|.//h5|.//h6|.//img|.//pre'
+_BREAK_BEFORE = re.compile(r'(?:page-)?break-before\s*:\s*(?:always|page|left|right)', re.IGNORECASE)
+_BREAK_AFTER = re.compile(r'(?:page-)?break-after\s*:\s*(?:always|page|left|right)', re.IGNORECASE)
+_PAGE_COUNTERS = re.compile(r'counter\(\s*pages?\s*[,)]')
+_PAGES_COUNTER = re.compile(r'counter\(\s*pages\s*(?:,[^)]*)?\)')
+
+
+def weight(element):
+    """Rough layout cost of an element: its rows, paragraphs, list items, headings and images"""
+    if not isinstance(element.tag, str):
+        return 0
+    return 1 + len(element.xpath(WEIGHED))
+
+
+def _shallow_copy(element, continued=False):
+    """Empty copy of element to wrap a piece of its children; continuations drop the id, text and break hints"""
+    clone = element.makeelement(element.tag, element.attrib)
+    if not continued:
+        clone.text = element.text
+        return clone
+    clone.attrib.pop('id', None)
+    style = _BREAK_BEFORE.sub('', clone.attrib.pop('style', '')).strip(' ;')
+    if style:
+        clone.set('style', style)
+    return clone
+
+
+def _table_parts(table):
+    """(head rows to repeat, body rows, the rest) of a table; a leading row of <th> cells counts as the header"""
+    head, rows, rest = [], [], []
+    for child in table:
+        tag = child.tag if isinstance(child.tag, str) else ''
+        if tag == 'thead':
+            head.append(child)
+        elif tag == 'tbody':
+            rows.extend(child)
+        elif tag == 'tr':
+            rows.append(child)
+        elif tag in ('caption', 'colgroup', 'col', 'tfoot'):
+            rest.append(child)
+    if not head and rows and all(cell.tag == 'th' for cell in rows[0] if isinstance(cell.tag, str)):
+        head.append(rows.pop(0))
+    return head, rows, rest
+
+
+def _row_groups(row_weights, budget, room):
+    """Sizes of consecutive row runs: the first weighs at most room, the others at most budget.
+
+    Every run gets at least two rows, and an even number of them unless it is the last.
+    """
+    sizes = []
+    start, used, limit = 0, 0, room
+    for index, row_weight in enumerate(row_weights):
+        count = index - start
+        if count >= 2 and used + row_weight > limit:
+            count -= count % 2
+            sizes.append(count)
+            start += count
+            used, limit = sum(row_weights[start:index]), budget
+        used += row_weight
+    sizes.append(len(row_weights) - start)
+    return sizes
+
+
+def split_table(table, budget, room=None):
+    """Cut a table into tables of about budget weight each, each repeating the header.
+
+    Rows are budgeted by their own weight; the first piece gets room instead of
+    budget, to fill what is left of the current chunk. Pieces keep the table's
+    attributes and <colgroup>; the <caption> stays on the first piece and the
+    <tfoot> on the last. Row counts per piece are even, so nth-child striping
+    lines up across the cuts.
+    """
+    head, rows, rest = _table_parts(table)
+    # Every piece carries the table element, its header and its caption/colgroup/footer
+    overhead = 1 + sum(weight(child) for child in head + rest)
+    room = budget if room is None else room
+    sizes = _row_groups([weight(row) for row in rows], budget - overhead, room - overhead)
+    if len(sizes) == 1:
+        return [table]
+
+    pieces = []
+    start = 0
+    for index, size in enumerate(sizes):
+        piece = _shallow_copy(table, continued=index > 0)
+        first, last = index == 0, index == len(sizes) - 1
+        for child in rest:
+            if child.tag != 'tfoot' and (first or child.tag != 'caption'):
+                piece.append(copy.deepcopy(child))
+        for header in head:
+            piece.append(copy.deepcopy(header))
+        body = piece.makeelement('tbody', {})
+        body.extend(copy.deepcopy(row) for row in rows[start:start + size])
+        piece.append(body)
+        if last:
+            piece.extend(copy.deepcopy(child) for child in rest if child.tag == 'tfoot')
+        pieces.append(piece)
+        start += size
+    pieces[-1].tail = table.tail
+    return pieces
+
+
+def split_block(element, budget, room=None):
+    """Cut an element into pieces of about budget weight at safe boundaries; unsplittable elements stay whole.
+
+    room is the weight the first piece may have, what is left of the chunk it
+    will be appended to; it defaults to a full budget.
+    """
+    room = budget if room is None else room
+    if weight(element) <= room:
+        return [element]
+    if element.tag == 'table':
+        return split_table(element, budget, room)
+    if element.tag not in SPLITTABLE:
+        return [element]
+
+    pieces = []
+    current, current_weight = _shallow_copy(element), 0
+    for child in list(element):
+        limit = room if not pieces else budget
+        for part in split_block(child, budget, limit - current_weight):
+            part_weight = weight(part)
+            if len(current) and current_weight + part_weight > limit:
+                pieces.append(current)
+                current, current_weight, limit = _shallow_copy(element, continued=True), 0, budget
+            current.append(part)
+            current_weight += part_weight
+    pieces.append(current)
+    pieces[-1].tail = element.tail
+    return pieces
+
+
+def _forces_break(element, pattern):
+    return isinstance(element.tag, str) and bool(pattern.search(element.get('style', '')))
+
+
+def split_html(input_file, budget=PDF_SPLIT_ROWS):
+    """Split an HTML document into standalone documents of about budget rows each.
+
+    Cuts fall between top-level blocks, between the children of plain
+    containers and between table row groups, and always at explicit page-break
+    hints. Every chunk carries the original <head>, so styles apply unchanged.
+    Returns (inner html of <head>, <body> attributes as html, [inner html of <body> per chunk]).
+    """
+    import lxml.html
+
+    document = lxml.html.parse(input_file, parser=lxml.html.HTMLParser(encoding='utf-8')).getroot()
+    head = document.find('head')
+    body = document.find('body')
+    if body is None:
+        body = document
+
+    chunks = []
+    current, current_weight = [], 0
+    for child in list(body):
+        if current and _forces_break(child, _BREAK_BEFORE):
+            chunks.append(current)
+            current, current_weight = [], 0
+        for part in split_block(child, budget, budget - current_weight):
+            part_weight = weight(part)
+            if current and current_weight + part_weight > budget:
+                chunks.append(current)
+                current, current_weight = [], 0
+            current.append(part)
+            current_weight += part_weight
+        if _forces_break(child, _BREAK_AFTER):
+            chunks.append(current)
+            current, current_weight = [], 0
+    if current:
+        chunks.append(current)
+
+    head_html = ''
+    if head is not None:
+        head_html = (head.text or '') + ''.join(lxml.html.tostring(child, encoding='unicode') for child in head)
+    body_attributes = ''.join(f' {name}="{value}"' for name, value in body.attrib.items()) if body is not document else ''
+    leading_text = body.text or ''
+    chunk_html = [''.join(lxml.html.tostring(part, encoding='unicode') for part in chunk) for chunk in chunks]
+    if chunk_html:
+        chunk_html[0] = leading_text + chunk_html[0]
+    return head_html, body_attributes, chunk_html
+
+
+def _chunk_document(head_html, body_attributes, body_html, page_offset=None, total_pages=None):
+    if total_pages is not None:
+        head_html = _PAGES_COUNTER.sub(f'"{total_pages}"', head_html)
+    if page_offset:
+        # The page counter is only auto-incremented on pages that don't touch it, hence offset + 1
+        head_html += f'<style>@page :first {{ counter-reset: page {page_offset + 1} }}</style>'
+    return f'<!DOCTYPE html><html><head>{head_html}</head><body{body_attributes}>{body_html}</body></html>'
+
+
+def _page_count(pdf_file):
+    from pypdf import PdfReader
+    return len(PdfReader(pdf_file).pages)
+
+
+def merge_pdfs(part_files, output_file):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for part_file in part_files:
+        writer.append(part_file)
+    with open(output_file, 'wb') as f:
+        writer.write(f)
+    writer.close()
+
+
+def split_worker_count():
+    """PDF_SPLIT_WORKERS for a top-level process; 1 inside a worker process, whose pool already fills the CPUs"""
+    return PDF_SPLIT_WORKERS if multiprocessing.parent_process() is None else 1
+
+
+def render_split(input_file, output_file, budget=PDF_SPLIT_ROWS, workers=None, renderer=None):
+    """Render a large HTML document chunk by chunk and merge the PDFs into output_file.
+
+    Chunks are rendered concurrently on a pool of warm WeasyPrint processes
+    (renderer, or a temporary PdfRenderer with workers processes, by default
+    split_worker_count()), or one after another in this process when workers is
+    1, which still caps peak memory at one chunk's layout. If the styles use counter(page) or counter(pages), the
+    chunks are rendered a second time knowing their page offsets and the total,
+    so page numbers run through the whole document. Stylesheets linked from
+    outside the document keep chunk-local page numbers.
+    """
+    head_html, body_attributes, chunks = split_html(input_file, budget)
+    logger.info(f"Rendering {input_file} as {len(chunks)} chunks")
+    if len(chunks) <= 1:
+        if renderer is not None:
+            return renderer.render(output_file, filename=input_file)
+        return write_pdf(output_file, filename=input_file)
+
+    workers = workers or split_worker_count()
+    own_renderer = renderer is None and workers > 1
+    if own_renderer:
+        renderer = PdfRenderer(max_workers=min(workers, len(chunks)))
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as work_dir:
+        def render_all(documents):
+            parts = []
+            pending = []
+            for index, document in enumerate(documents):
+                html_file = os.path.join(work_dir, f'chunk{index}.html')
+                with open(html_file, 'w', encoding='utf-8') as f:
+                    f.write(document)
+                parts.append(os.path.join(work_dir, f'chunk{index}.pdf'))
+                if renderer is None:
+                    write_pdf(parts[-1], filename=html_file)
+                else:
+                    pending.append(renderer.submit(parts[-1], filename=html_file))
+            for future in pending:
+                future.result()
+            return parts
+
+        try:
+            parts = render_all(_chunk_document(head_html, body_attributes, chunk) for chunk in chunks)
+            if _PAGE_COUNTERS.search(head_html):
+                page_counts = [_page_count(part) for part in parts]
+                offsets = [sum(page_counts[:index]) for index in range(len(page_counts))]
+                parts = render_all(_chunk_document(head_html, body_attributes, chunk, offset, sum(page_counts))
+                                   for chunk, offset in zip(chunks, offsets))
+            merge_pdfs(parts, output_file)
+        finally:
+            if own_renderer:
+                renderer.shutdown()
+    return output_file
@@ -0,0 +1,238 @@
+import logging
+import os
+import zlib
+from datetime import date, datetime, time
+from xlsx_reader import ROW_CHUNK_SIZE, iter_row_chunks, open_workbook
+from xlsx_to_html import (PAGE_HEIGHT_PX, PAGE_TOP_MARGIN_PX, PAGE_WIDTH_PX, display_value, plain_style_ids,
+                          read_sheet_layout)
+
+logger = logging.getLogger(__name__)
+
+# Render plain grid workbooks straight to PDF instead of through HTML and WeasyPrint
+EXCEL_PDF_TABLES = os.environ.get('EXCEL_PDF_TABLES', 'on').lower() != 'off'
+
+PX_TO_PT = 0.75
+FONT_SIZE = 9.0  # Helvetica 9pt digits are about as wide as Calibri 11pt, which Excel column widths assume
+DEFAULT_ROW_HEIGHT = 15.0  # points, Excel's default
+CELL_PADDING = 1.5  # points, the 2px the HTML path pads cells with
+BASELINE_OFFSET = 3.5  # points from the bottom of a row to the text baseline
+
+# Helvetica advance widths (1/1000 em) for WinAnsi codes 32-126; other codes use 556
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+GLYPH_WIDTHS = [556] * 32 + HELVETICA_WIDTHS + [556] * 129
+NUMERIC_TYPES = (int, float, datetime, date, time)
+
+
+def _escape(encoded):
+    return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'')
+
+
+def fit_text(text, width, size=FONT_SIZE):
+    """text encoded for Helvetica/WinAnsi, cut to what fits in width points; returns (bytes, width used).
+
+    Raises UnicodeEncodeError for characters the standard font can't show.
+    """
+    encoded = text.replace('\n', ' ').encode('cp1252')
+    limit = width * 1000 / size
+    used = sum(map(GLYPH_WIDTHS.__getitem__, encoded))
+    if used <= limit:
+        return encoded, used * size / 1000
+    used = 0
+    for index, code in enumerate(encoded):
+        if used + GLYPH_WIDTHS[code] > limit:
+            return encoded[:index], used * size / 1000
+        used += GLYPH_WIDTHS[code]
+    return encoded, used * size / 1000
+
+
+class TablePdf:
+    """Minimal PDF writer for text-only pages set in Helvetica.
+
+    Each page is compressed and written to the file as soon as it is added;
+    only object offsets and page ids are kept until close() writes the page
+    tree and cross-reference table, so memory doesn't grow with the page count.
+    """
+
+    CATALOG, PAGES, FONT = 1, 2, 3
+
+    def __init__(self, output_file):
+        self._file = open(output_file, 'wb')
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = self.FONT + 1
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._write_object(self.FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                      b'/Encoding /WinAnsiEncoding >>')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def _write_object(self, object_id, body):
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(b'%d 0 obj\n' % object_id + body + b'\nendobj\n')
+
+    def _allocate(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    def add_page(self, width, height, content):
+        """Write one page of width x height points drawn by the content stream operators"""
+        content_id, page_id = self._allocate(), self._allocate()
+        data = zlib.compress(content)
+        self._write_object(content_id, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(data)
+                           + data + b'\nendstream')
+        self._write_object(page_id, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] '
+                                    b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+                           % (self.PAGES, width, height, self.FONT, content_id))
+        self._page_ids.append(page_id)
+
+    def close(self):
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self._page_ids)
+        self._write_object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self._page_ids)))
+        self._write_object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        xref_offset = self._file.tell()
+        self._file.write(b'xref\n0 %d\n0000000000 65535 f \n' % self._next_id)
+        for object_id in range(1, self._next_id):
+            self._file.write(b'%010d 00000 n \n' % self._offsets[object_id])
+        self._file.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                         % (self._next_id, self.CATALOG, xref_offset))
+        self._file.close()
+
+
+class SheetPages:
+    """Lays one sheet's rows out on pages with fixed column positions and a repeated header row.
+
+    Column offsets and the page size are computed once from the sheet layout:
+    A4 landscape scaled up to the sheet's width, like the HTML path's named
+    pages. Rows are drawn as they arrive and a page is handed to the writer as
+    soon as it is full.
+    """
+
+    def __init__(self, pdf, layout):
+        self.pdf = pdf
+        self.row_heights = layout.row_heights
+        scale = max(1.0, sum(layout.column_widths) / PAGE_WIDTH_PX)
+        self.width = PAGE_WIDTH_PX * scale * PX_TO_PT
+        self.height = PAGE_HEIGHT_PX * scale * PX_TO_PT
+        self.top = self.height - PAGE_TOP_MARGIN_PX * scale * PX_TO_PT
+        # (column index, left edge, width) of the visible columns, in points
+        self.columns = []
+        left = 0.0
+        for index, width in enumerate(layout.column_widths):
+            if width:
+                self.columns.append((index, left, width * PX_TO_PT))
+                left += width * PX_TO_PT
+        self.header = None
+        self._operators = []
+        self._y = self.top
+
+    def _draw_row(self, values, height):
+        baseline = self._y - height + BASELINE_OFFSET
+        for index, left, width in self.columns:
+            value = values[index] if index < len(values) else None
+            if value is None:
+                continue
+            text, text_width = fit_text(display_value(value), width - 2 * CELL_PADDING)
+            if not text:
+                continue
+            x = left + CELL_PADDING
+            if isinstance(value, NUMERIC_TYPES) and not isinstance(value, bool):
+                x = left + width - CELL_PADDING - text_width
+            self._operators.append(b'1 0 0 1 %.2f %.2f Tm (%s) Tj' % (x, baseline, _escape(text)))
+        self._y -= height
+
+    def add_row(self, row_index, values):
+        height = self.row_heights.get(row_index, DEFAULT_ROW_HEIGHT)
+        if self._y - height < 0 and self._y < self.top:
+            self.flush()
+            if self.header is not None:
+                self._draw_row(*self.header)
+        self._draw_row(values, height)
+
+    def flush(self):
+        """Emit the page drawn so far"""
+        content = b'BT /F1 %g Tf\n' % FONT_SIZE + b'\n'.join(self._operators) + b'\nET'
+        self.pdf.add_page(self.width, self.height, content)
+        self._operators = []
+        self._y = self.top
+
+
+def _is_header(values):
+    """A first row of text only (at least one cell) is repeated on every page"""
+    filled = [value for value in values if value is not None]
+    return bool(filled) and all(isinstance(value, str) for value in filled)
+
+
+def is_plain_sheet(layout, plain_styles):
+    """True when a sheet is a bare grid: no merges and only default-looking cell styles"""
+    return not layout.spans and layout.style_ids <= plain_styles
+
+
+def is_winansi(strings):
+    """True when Helvetica without an embedded font can show every string (cp1252 covers WinAnsi)"""
+    try:
+        for string in strings:
+            str(string).encode('cp1252')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def convert_plain_workbook(input_file, output_file, chunk_size=ROW_CHUNK_SIZE):
+    """Render every visible sheet of a plain grid workbook straight to PDF; returns False for any other workbook.
+
+    Nothing is left behind when the workbook has merged cells, styled cells or
+    text outside WinAnsi (Cyrillic, Greek, CJK, ...), so the caller can fall back
+    to the HTML path. Shared strings are checked up front; inline strings only
+    show up while rendering, which is then abandoned. Otherwise rows are streamed
+    from the read-only workbook in chunks and pages are written as they fill, one
+    page run per sheet.
+    """
+    with open_workbook(input_file) as workbook:
+        sheets = [worksheet for worksheet in workbook.worksheets if worksheet.sheet_state == 'visible']
+        layouts = [read_sheet_layout(worksheet) for worksheet in sheets]
+        plain_styles = plain_style_ids(workbook)
+        if not all(is_plain_sheet(layout, plain_styles) for layout in layouts):
+            logger.debug(f"{input_file} has merged or styled cells, not a plain grid")
+            return False
+        # Every read-only worksheet holds the workbook's one shared string table
+        shared_strings = getattr(sheets[0], '_shared_strings', ()) if sheets else ()
+        if not is_winansi(shared_strings):
+            logger.debug(f"{input_file} has text Helvetica can't show, not a plain grid")
+            return False
+
+        try:
+            with TablePdf(output_file) as pdf:
+                for worksheet, layout in zip(sheets, layouts):
+                    pages = SheetPages(pdf, layout)
+                    max_column = len(layout.column_widths)
+                    rows = enumerate(worksheet.iter_rows(max_col=max_column or None, values_only=True), start=1)
+                    for chunk in iter_row_chunks(rows, chunk_size):
+                        for row_index, values in chunk:
+                            if row_index == 1 and _is_header(values):
+                                pages.header = (values, layout.row_heights.get(1, DEFAULT_ROW_HEIGHT))
+                            pages.add_row(row_index, values)
+                    pages.flush()
+                logger.debug(f"Rendered {len(sheets)} plain sheets to {pdf.page_count} pages")
+        except UnicodeEncodeError:
+            logger.debug(f"{input_file} has inline text Helvetica can't show, not a plain grid")
+            os.remove(output_file)
+            return False
+    return True
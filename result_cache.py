@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Content-addressed store of converted outputs on local disk.
+
+    Entries are keyed on the input's SHA-256 plus everything that affects the
+    output (source type, target format, engine options, converter version).
+    An entry's mtime records when it was stored and is used for the TTL; its
+    atime is bumped on every hit and drives least-recently-used eviction once
+    the directory grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, ttl_seconds=24 * 60 * 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.environ.get('CONVERSION_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pdfconverter-cache')),
+            max_bytes=int(os.environ.get('CONVERSION_CACHE_MAX_MB', 1024)) * 1024 * 1024,
+            ttl_seconds=int(os.environ.get('CONVERSION_CACHE_TTL', 24 * 60 * 60)),
+        )
+
+    def key(self, input_file, *parts):
+        meta = '|'.join(str(part) for part in parts)
+        return hashlib.sha256(f'{file_digest(input_file)}|{meta}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def fetch(self, key, destination):
+        """Copy a live entry to destination and return True, or return False on a miss"""
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.ttl_seconds:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            shutil.copyfile(path, destination)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            self._count(hit=False)
+            return False
+        self._count(hit=True)
+        return True
+
+    def store(self, key, output_file):
+        # Written under a unique name and renamed so readers never see a partial entry
+        partial = self._path(f'{key}.{uuid.uuid4().hex}.partial')
+        try:
+            shutil.copyfile(output_file, partial)
+            os.replace(partial, self._path(key))
+        except OSError as e:
+            logger.error(f"Could not cache {output_file}: {e}")
+            if os.path.exists(partial):
+                os.remove(partial)
+            return
+        self.evict()
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.partial'):
+                continue
+            try:
+                stat = entry.stat()
+                if now - stat.st_mtime > self.ttl_seconds:
+                    os.remove(entry.path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        sizes = [entry.stat().st_size for entry in os.scandir(self.directory) if not entry.name.endswith('.partial')]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(sizes),
+            'bytes': sum(sizes),
+        }
@@ -0,0 +1,84 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+SESSION_RESULTS_MAX_ENTRIES = 32
+SESSION_RESULTS_MAX_BYTES = int(os.environ.get('SESSION_RESULTS_MAX_MB', 512)) * 1024 * 1024
+
+ResultEntry = namedtuple('ResultEntry', ['name', 'path', 'size'])
+
+
+def result_key(data, *parts):
+    """Key for an output: the upload's content hash plus everything that changes the result"""
+    digest = hashlib.sha256(data).hexdigest()
+    return hashlib.sha256('|'.join([digest] + [str(part) for part in parts]).encode()).hexdigest()
+
+
+class SessionResults:
+    """Converted outputs of one Streamlit session, kept on disk across reruns.
+
+    Only names and paths are held in memory. Once max_entries or max_bytes is
+    exceeded the least recently used outputs are deleted, and the directory is
+    removed when the store is garbage collected with its session (or at exit).
+    """
+
+    def __init__(self, max_entries=SESSION_RESULTS_MAX_ENTRIES, max_bytes=SESSION_RESULTS_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = tempfile.mkdtemp(prefix='pdfconverter-session-')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def output_path(self, key, name):
+        """Where the output for key should be written before it is added"""
+        directory = os.path.join(self.directory, key)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def workdir(self):
+        """Scratch directory for a batch's inputs, inside the session directory"""
+        return tempfile.mkdtemp(prefix='work-', dir=self.directory)
+
+    def add(self, key, path):
+        entry = ResultEntry(os.path.basename(path), path, os.path.getsize(path))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+        self._evict()
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and not os.path.exists(entry.path):
+            self.discard(key)
+            return None
+        return entry
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+    def _evict(self):
+        with self._lock:
+            evicted = []
+            total = sum(entry.size for entry in self._entries.values())
+            # The newest entry always stays, even if it alone is over the limit
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or total > self.max_bytes):
+                key, entry = self._entries.popitem(last=False)
+                total -= entry.size
+                evicted.append(key)
+        for key in evicted:
+            logger.debug(f"Evicting session result {key}")
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
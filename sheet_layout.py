@@ -0,0 +1,138 @@
+import logging
+from array import array
+import numpy as np
+from openpyxl.utils import get_column_letter
+
+logger = logging.getLogger(__name__)
+
+POINTS_PER_LINE = 15.0
+WRAP_FACTOR = 1.1  # a wrapped line holds about width / 1.1 characters
+AUTOSIZE_PADDING = 2
+AUTOSIZE_MAX_WIDTH = 60
+DEFAULT_COLUMN_WIDTH = 13.0  # what openpyxl reports for a column without its own dimension
+
+
+class LayoutEstimator:
+    """Collects cell text metrics while a sheet is written and sizes its rows and columns in bulk.
+
+    add() only appends a few integers per cell to typed buffers; the sizing
+    methods turn them into NumPy arrays and compute every row height and column
+    width with vectorized operations, so nothing walks the worksheet cell by
+    cell afterwards. Merged cells are recorded on their anchor with the number
+    of columns they span.
+    """
+
+    def __init__(self):
+        self._rows = array('q')
+        self._columns = array('q')
+        self._spans = array('q')
+        self._lengths = array('q')
+        self._newlines = array('q')
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, row, column, text, span=1):
+        if not text:
+            return
+        self._rows.append(row)
+        self._columns.append(column)
+        self._spans.append(span)
+        self._lengths.append(len(text))
+        self._newlines.append(text.count('\n'))
+
+    def _arrays(self):
+        return tuple(np.frombuffer(buffer, dtype=np.int64) if len(buffer) else np.zeros(0, dtype=np.int64)
+                     for buffer in (self._rows, self._columns, self._spans, self._lengths, self._newlines))
+
+    @property
+    def max_row(self):
+        return int(np.frombuffer(self._rows, dtype=np.int64).max()) if self._rows else 0
+
+    @property
+    def max_column(self):
+        if not self._columns:
+            return 0
+        columns, spans = np.frombuffer(self._columns, dtype=np.int64), np.frombuffer(self._spans, dtype=np.int64)
+        return int((columns + spans - 1).max())
+
+    def _spanned_widths(self, column_widths, columns, spans):
+        """Width of every recorded cell: its column, or the sum of the columns it spans.
+
+        column_widths is indexed by column number (index 0 unused). The columns are
+        added left to right, in the same order a plain sum() over them would use.
+        """
+        padded = np.concatenate([column_widths, np.zeros(int(spans.max()) if len(spans) else 0)])
+        widths = np.zeros(len(columns))
+        for offset in range(int(spans.max()) if len(spans) else 0):
+            widths += np.where(offset < spans, padded[columns + offset], 0.0)
+        return widths
+
+    def row_lines(self, column_widths, max_row=0):
+        """Lines of wrapped text in each row's tallest cell, indexed by row number (index 0 unused)"""
+        rows, columns, spans, lengths, newlines = self._arrays()
+        lines = np.ones(max(self.max_row, max_row) + 1, dtype=np.int64)
+        if not len(rows):
+            return lines
+        widths = self._spanned_widths(np.asarray(column_widths, dtype=float), columns, spans)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wrapped = np.where(widths > 0, np.ceil(lengths / (widths / WRAP_FACTOR)), 1)
+        cell_lines = np.maximum(newlines + 1, wrapped.astype(np.int64))
+        np.maximum.at(lines, rows, cell_lines)
+        return lines
+
+    def column_widths(self, padding=AUTOSIZE_PADDING, max_width=AUTOSIZE_MAX_WIDTH):
+        """Autosized width per column (index 0 unused): the longest text plus padding, capped at max_width.
+
+        A merged cell only widens its columns when its text doesn't fit their
+        combined width, and then spreads the shortfall evenly across them.
+        """
+        rows, columns, spans, lengths, newlines = self._arrays()
+        widths = np.zeros(self.max_column + 1)
+        single = spans == 1
+        np.maximum.at(widths, columns[single], lengths[single] + padding)
+
+        merged = ~single
+        if merged.any():
+            merged_columns, merged_spans = columns[merged], spans[merged]
+            shortfall = lengths[merged] + padding - self._spanned_widths(widths, merged_columns, merged_spans)
+            needs = shortfall > 0
+            if needs.any():
+                share = shortfall[needs] / merged_spans[needs]
+                starts, counts = merged_columns[needs], merged_spans[needs]
+                # One entry per spanned column: start + 0, start + 1, ... for every short merge
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                extra = np.zeros_like(widths)
+                np.maximum.at(extra, np.repeat(starts, counts) + offsets, np.repeat(share, counts))
+                widths += extra
+        return np.minimum(widths, max_width)
+
+    def apply_row_heights(self, worksheet, column_widths, points_per_line=POINTS_PER_LINE):
+        """Set every row of the sheet to its tallest cell's height; rows without text get one line"""
+        lines = self.row_lines(column_widths, worksheet.max_row)
+        heights = (lines * points_per_line).tolist()
+        row_dimensions = worksheet.row_dimensions
+        for row_index in range(1, len(heights)):
+            row_dimensions[row_index].height = heights[row_index]
+        logger.debug(f"Sized {len(heights) - 1} rows from {len(self)} cells")
+
+    def apply_column_widths(self, worksheet, padding=AUTOSIZE_PADDING, max_width=AUTOSIZE_MAX_WIDTH):
+        widths = self.column_widths(padding, max_width).tolist()
+        for column_index in range(1, len(widths)):
+            if widths[column_index]:
+                worksheet.column_dimensions[get_column_letter(column_index)].width = widths[column_index]
+
+
+def layout_column_widths(widths, max_column):
+    """Widths of columns 1..max_column as an array indexed by column number; columns past widths get the default"""
+    column_widths = np.full(max(len(widths), max_column) + 1, DEFAULT_COLUMN_WIDTH)
+    column_widths[1:len(widths) + 1] = widths
+    return column_widths
+
+
+def sheet_column_widths(worksheet, max_column):
+    """Current width of columns 1..max_column as an array indexed by column number"""
+    widths = np.zeros(max_column + 1)
+    for column_index in range(1, max_column + 1):
+        widths[column_index] = worksheet.column_dimensions[get_column_letter(column_index)].width
+    return widths
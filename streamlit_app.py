@@ -1,22 +1,21 @@
 import streamlit as st
 import os
-import tempfile
-import magic
-import uuid
-import pandas as pd
-from bs4 import BeautifulSoup
-import math
-import re
-import webcolors
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.styles.borders import Border, Side
-from openpyxl.utils import get_column_letter
+import functools
+import shutil
 import logging
 import traceback
+from contextlib import nullcontext
 from zipfile import ZipFile
-import base64
 import platform
+import time
+from urllib.parse import urlsplit
+from batch import BatchConverter
+from converters import EXCEL_WRITE_ONLY_MIN_BYTES, ConversionJob
+from result_cache import ConversionCache
+from zip_stream import compression_settings
+from session_results import SessionResults, result_key
+from download_server import DownloadServer
+from upload_validation import UploadRejected, save_upload
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -30,278 +29,98 @@ st.set_page_config(
 )
 
 ALLOWED_EXTENSIONS = {'docx', 'xlsx', 'html'}
-MIME_TYPES = {
-    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    'html': 'text/html'
-}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def validate_mime_type(filepath, ext):
-    try:
-        mime = magic.from_file(filepath, mime=True)
-        expected_mime = MIME_TYPES.get(ext)
-        logger.debug(f"File MIME type: {mime}, Expected MIME type: {expected_mime}")
-        return mime == expected_mime
-    except Exception as e:
-        logger.error(f"Error validating MIME type for {filepath}: {e}")
-        return False
-
-def convert_to_excel(input_file, output_file):
-    PIXELS_TO_EXCEL_UNITS = 8.43 
-
-    with open(input_file, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-
-    soup = BeautifulSoup(html_content, 'html.parser')
-    tables = soup.find_all('table')
-
-    if not tables:
-        text = soup.get_text(separator='\n', strip=True)
-        df = pd.DataFrame([line for line in text.split('\n') if line], columns=['Content'])
-        df.to_excel(output_file, index=False)
-        return
-
-    workbook = Workbook()
-    worksheet = workbook.active
-    
-    thin_black_side = Side(style='thin', color='FF000000')
-    default_border = Border(left=thin_black_side, right=thin_black_side, top=thin_black_side, bottom=thin_black_side)
-
-    master_layout_pixels = []
-    max_cols = 0
-    for table in tables:
-        cols = table.find_all('col')
-        if len(cols) > max_cols:
-            max_cols = len(cols)
-            master_layout_pixels = []
-            for col in cols:
-                style = col.get('style', '')
-                match = re.search(r'width:\s*(\d+)', style)
-                if match:
-                    master_layout_pixels.append(int(match.group(1)))
-
-    if not master_layout_pixels:
-        logger.error("Could not determine a master layout from <colgroup> tags.")
-        pd.read_html(html_content).to_excel(output_file, index=False)
-        return
-
-    master_layout_excel_units = [px / PIXELS_TO_EXCEL_UNITS for px in master_layout_pixels]
-    for i, width in enumerate(master_layout_excel_units):
-        worksheet.column_dimensions[get_column_letter(i + 1)].width = width
-
-    current_row_excel = 1
-    for table in tables:
-        local_layout_pixels = []
-        local_cols = table.find_all('col')
-        if local_cols:
-            for col in local_cols:
-                style = col.get('style', '')
-                match = re.search(r'width:\s*(\d+)', style)
-                if match: local_layout_pixels.append(int(match.group(1)))
-
-        rows = table.find_all('tr')
-        for row in rows:
-            cells = row.find_all(['td', 'th'])
-            current_col_excel = 1
-            
-            for cell_idx, cell in enumerate(cells):
-                text = cell.get_text(strip=True)
-                style_str = cell.get('style', '') + row.get('style', '')
-                
-                bg_color_html = cell.get('bgcolor')
-                if not bg_color_html:
-                    bg_match = re.search(r'background-color:\s*([^;]+)', style_str)
-                    if bg_match: bg_color_html = bg_match.group(1).strip()
-                font_color_html = None
-                color_match = re.search(r'(?<!background-)color:\s*([^;]+)', style_str)
-                if color_match: font_color_html = color_match.group(1).strip()
-                align_map = {'center': 'center', 'left': 'left', 'right': 'right', 'justify': 'justify'}
-                text_align = 'general'
-                align_match = re.search(r'text-align:\s*([^;]+)', style_str)
-                if align_match: text_align = align_map.get(align_match.group(1).strip().lower(), 'general')
-                is_bold = 'font-weight: bold' in style_str or cell.find('b') or cell.name == 'th'
-
-                html_colspan = int(cell.get('colspan', 1))
-                
-                target_pixel_width = 0
-                if local_layout_pixels and cell_idx < len(local_layout_pixels):
-                    for i in range(html_colspan):
-                        if (cell_idx + i) < len(local_layout_pixels):
-                            target_pixel_width += local_layout_pixels[cell_idx + i]
-                
-                excel_colspan = 0
-                covered_width = 0
-                if target_pixel_width > 0:
-                    start_master_col_idx = current_col_excel - 1
-                    while covered_width < (target_pixel_width * 0.9) and (start_master_col_idx + excel_colspan) < len(master_layout_pixels):
-                        covered_width += master_layout_pixels[start_master_col_idx + excel_colspan]
-                        excel_colspan += 1
-                excel_colspan = max(1, excel_colspan)
+@st.cache_resource
+def get_batch_converter():
+    """One conversion process pool per server process, shared by every session and rerun"""
+    return BatchConverter()
 
-                alignment = Alignment(horizontal=text_align, vertical='center', wrap_text=True)
-                font = Font(bold=bool(is_bold))
-                fill = None
-                bg_color_argb = html_color_to_openpyxl_argb(bg_color_html)
-                if bg_color_argb:
-                    try: fill = PatternFill(start_color=bg_color_argb, end_color=bg_color_argb, fill_type="solid")
-                    except ValueError: fill = None
-                font_color_argb = html_color_to_openpyxl_argb(font_color_html)
-                if font_color_argb:
-                    try: font.color = font_color_argb
-                    except ValueError: pass
+@st.cache_resource
+def get_conversion_cache():
+    """Disk cache of converted outputs, shared like the process pool"""
+    return ConversionCache.from_env()
 
-                target_cell = worksheet.cell(row=current_row_excel, column=current_col_excel)
-                target_cell.value = text
-                target_cell.alignment = alignment
-                if fill: target_cell.fill = fill
-                target_cell.font = font
+def get_session_results():
+    """This session's store of converted outputs; its files are removed with the session"""
+    if 'results' not in st.session_state:
+        st.session_state['results'] = SessionResults()
+    return st.session_state['results']
 
-                if excel_colspan > 1:
-                    end_col = current_col_excel + excel_colspan - 1
-                    worksheet.merge_cells(start_row=current_row_excel, start_column=current_col_excel, end_row=current_row_excel, end_column=end_col)
-                    for r_offset in range(1):
-                        for c_offset in range(excel_colspan):
-                             worksheet.cell(row=current_row_excel + r_offset, column=current_col_excel + c_offset).border = default_border
-                else:
-                    target_cell.border = default_border
-                
-                current_col_excel += excel_colspan
-            current_row_excel += 1
-        current_row_excel += 1
+@st.cache_resource
+def get_download_server():
+    """Side HTTP server that streams outputs from disk (DOWNLOAD_SERVER_* env vars).
 
-    POINTS_PER_LINE = 15.0
-    for row_index in range(1, worksheet.max_row + 1):
-        max_lines_in_row = 1
-        for cell in worksheet[row_index]:
-            if not cell.value: continue
-            
-            effective_width_units = 0
-            is_merged = False
-            for merged_range in worksheet.merged_cells.ranges:
-                if cell.coordinate in merged_range:
-                    for col_idx in range(merged_range.min_col, merged_range.max_col + 1):
-                        effective_width_units += worksheet.column_dimensions[get_column_letter(col_idx)].width
-                    is_merged = True
-                    break
-            if not is_merged:
-                effective_width_units = worksheet.column_dimensions[cell.column_letter].width
-
-            text = str(cell.value)
-            lines_from_newlines = text.count('\n') + 1
-            lines_from_wrapping = 1
-            if effective_width_units > 0:
-                lines_from_wrapping = math.ceil(len(text) / (effective_width_units / 1.1))
-
-            cell_lines = max(lines_from_newlines, lines_from_wrapping)
-            if cell_lines > max_lines_in_row:
-                max_lines_in_row = cell_lines
-        
-        worksheet.row_dimensions[row_index].height = max_lines_in_row * POINTS_PER_LINE
-
-    workbook.save(output_file)
-    
-def html_color_to_openpyxl_argb(html_color):
-    if not html_color:
+    Returns None when disabled with DOWNLOAD_SERVER=off or when the port is
+    unavailable; downloads then go through st.download_button instead.
+    """
+    if os.environ.get('DOWNLOAD_SERVER', 'on').lower() == 'off':
+        logger.warning("Download server disabled, Streamlit buffers each download in memory")
         return None
-    
-    html_color = html_color.lower().strip()
-    
     try:
-        if html_color.startswith('#'):
-            hex_val = html_color.lstrip('#')
-        else:
-            hex_val = webcolors.name_to_hex(html_color).lstrip('#')
-
-        if len(hex_val) == 3:
-            hex_val = "".join([c*2 for c in hex_val])
-        
-        if len(hex_val) == 6:
-            return 'FF' + hex_val.upper()
-        else:
-            return None
-            
-    except ValueError:
+        return DownloadServer.from_env()
+    except OSError as e:
+        logger.warning(f"Download server unavailable, Streamlit buffers each download in memory: {e}")
         return None
 
-def convert_docx_to_pdf(input_file, output_file):
-    """Convert DOCX to PDF using docx2pdf"""
-    try:
-        from docx2pdf import convert as docx_convert
-        
-        # Check if we're on Windows
-        if platform.system() == "Windows":
-            import pythoncom
-            pythoncom.CoInitialize()
-            try:
-                docx_convert(input_file, output_file)
-                return True
-            finally:
-                pythoncom.CoUninitialize()
-        else:
-            # For non-Windows platforms, try without COM initialization
-            docx_convert(input_file, output_file)
-            return True
-    except Exception as e:
-        st.error(f"Error converting DOCX to PDF: {str(e)}")
-        logger.error(f"DOCX to PDF conversion error: {str(e)}")
-        return False
+def download_base_url(server):
+    """Where this session's browser reaches the download server, or None when it can't.
 
-def convert_excel_to_pdf(input_file, output_file):
-    """Convert Excel to PDF using pandas and weasyprint"""
-    try:
-        # Read Excel file
-        df = pd.read_excel(input_file)
-        
-        # Create HTML table
-        html_content = df.to_html(index=False, classes='table table-striped')
-        
-        # Convert HTML to PDF
-        from weasyprint import HTML
-        HTML(string=html_content).write_pdf(output_file)
-        return True
-    except Exception as e:
-        st.error(f"Error converting Excel to PDF: {str(e)}")
-        logger.error(f"Excel to PDF conversion error: {str(e)}")
-        return False
+    DOWNLOAD_BASE_URL wins. Otherwise the link uses the host name the browser
+    has the app open under, with the download server's port. That doesn't work
+    behind a reverse proxy (X-Forwarded-* headers), which only forwards the
+    app's own port, nor from an https page, which browsers won't let download
+    over plain http.
+    """
+    if server.base_url is not None:
+        return server.base_url
+    if any(name.lower().startswith('x-forwarded-') for name in st.context.headers):
+        return None
+    app_url = urlsplit(st.context.url or '')
+    if app_url.scheme != 'http' or not app_url.hostname:
+        return None
+    host = f'[{app_url.hostname}]' if ':' in app_url.hostname else app_url.hostname
+    return f'http://{host}:{server.port}'
 
-def convert_html_to_pdf(input_file, output_file):
-    """Convert HTML to PDF using weasyprint"""
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
-        from weasyprint import HTML
-        HTML(string=html_content).write_pdf(output_file)
-        return True
-    except Exception as e:
-        st.error(f"Error converting HTML to PDF: {str(e)}")
-        logger.error(f"HTML to PDF conversion error: {str(e)}")
-        return False
+def get_file_download_link(entry):
+    """Expiring link that streams a SessionResults entry from disk, or None when the browser can't reach one"""
+    server = get_download_server()
+    if server is None:
+        return None
+    base_url = download_base_url(server)
+    if base_url is None:
+        if not st.session_state.get('buffered_downloads_logged'):
+            st.session_state['buffered_downloads_logged'] = True
+            logger.warning(f"Browser at {st.context.url or 'an unknown URL'} can't reach the download server, "
+                           f"set DOWNLOAD_BASE_URL; Streamlit buffers each download in memory")
+        return None
+    return server.url_for(entry.path, entry.name, base_url)
 
-def get_file_download_link(file_path, file_name):
-    """Generate a download link for a file"""
-    with open(file_path, "rb") as f:
-        data = f.read()
-    b64 = base64.b64encode(data).decode()
-    return f'<a href="data:application/octet-stream;base64,{b64}" download="{file_name}">Download {file_name}</a>'
+def read_output(path):
+    """Bytes of an output file, read only when its download button is clicked"""
+    with open(path, "rb") as f:
+        return f.read()
 
-def create_download_button(file_path, file_name, button_text=None):
-    """Create a Streamlit download button"""
+def create_download_button(entry, key, button_text=None):
+    """Create a download button for a SessionResults entry"""
     if button_text is None:
-        button_text = f"📥 Download {file_name}"
+        button_text = f"📥 Download {entry.name}"
     
-    with open(file_path, "rb") as f:
-        file_data = f.read()
+    link = get_file_download_link(entry)
+    if link is not None:
+        st.link_button(button_text, link)
+        return
     
+    # Fallback: the file is only read when the button is clicked, so reruns
+    # don't load any outputs; the key is the result's, so the widget is stable
     st.download_button(
         label=button_text,
-        data=file_data,
-        file_name=file_name,
+        data=functools.partial(read_output, entry.path),
+        file_name=entry.name,
         mime="application/octet-stream",
-        key=f"download_{file_name}_{uuid.uuid4().hex[:8]}"
+        key=f"download_{key}"
     )
 
 def main():
@@ -339,15 +158,33 @@ def main():
             ["PDF", "Excel"],
             help="Choose the desired output format for your files"
         )
+        zip_compression = st.selectbox(
+            "Zip compression (multiple files):",
+            ["None", "Standard", "Maximum"],
+            help="PDF and Excel files are already compressed, so 'None' is fastest and barely larger"
+        )
+        compression, compresslevel = compression_settings({"None": 0, "Standard": 6, "Maximum": 9}[zip_compression])
+        sheet_per_table = output_format == "Excel" and st.checkbox(
+            "One worksheet per table",
+            help="Give every HTML table its own sheet and column layout instead of stacking them on one sheet"
+        )
+        
+        # Outputs live in the session's results store, so reruns (e.g. clicking a
+        # download button) show them again without converting anything
+        results = get_session_results()
+        batch_signature = (output_format, zip_compression, sheet_per_table, tuple((f.name, f.size) for f in uploaded_files))
         
         # Convert button
         if st.button("🔄 Convert Files", type="primary"):
             if uploaded_files:
                 with st.spinner("Converting files..."):
                     try:
-                        with tempfile.TemporaryDirectory() as tmpdirname:
-                            output_files = []
-                            base_filenames = []
+                        tmpdirname = results.workdir()
+                        try:
+                            output_keys = []
+                            reused = []
+                            jobs = []
+                            keys = {}
                             
                             for file in uploaded_files:
                                 # Validate file type
@@ -355,77 +192,120 @@ def main():
                                     st.error(f"Unsupported file type: {file.name}")
                                     continue
                                 
-                                # Save uploaded file
-                                filepath = os.path.join(tmpdirname, file.name)
-                                with open(filepath, "wb") as f:
-                                    f.write(file.getbuffer())
-                                
                                 ext = file.name.rsplit('.', 1)[1].lower()
-                                
-                                # Validate MIME type
-                                if not validate_mime_type(filepath, ext):
-                                    st.error(f"File type mismatch for {file.name}")
+                                if output_format == 'Excel' and ext != 'html':
+                                    st.error(f"Converting {ext} to Excel is not supported")
                                     continue
                                 
                                 base_filename = os.path.splitext(file.name)[0]
-                                base_filenames.append(base_filename)
                                 output_extension = '.pdf' if output_format == 'PDF' else '.xlsx'
-                                output_file = os.path.join(tmpdirname, f'{base_filename}{output_extension}')
+                                key = result_key(file.getbuffer(), ext, output_format, sheet_per_table)
                                 
+                                # Already converted earlier in this session
+                                if results.get(key) is not None:
+                                    reused.append(key)
+                                    continue
+                                
+                                # Save uploaded file, validating its type from the first bytes and the ZIP directory
+                                filepath = os.path.join(tmpdirname, file.name)
+                                file.seek(0)
                                 try:
-                                    if output_format == 'PDF':
-                                        if ext == 'docx':
-                                            success = convert_docx_to_pdf(filepath, output_file)
-                                        elif ext == 'xlsx':
-                                            success = convert_excel_to_pdf(filepath, output_file)
-                                        elif ext == 'html':
-                                            success = convert_html_to_pdf(filepath, output_file)
-                                        else:
-                                            st.error(f"Converting {ext} to PDF is not supported")
-                                            continue
-                                    else:  # Excel
-                                        if ext == 'html':
-                                            convert_to_excel(filepath, output_file)
-                                            success = True
-                                        else:
-                                            st.error(f"Converting {ext} to Excel is not supported")
-                                            continue
-                                    
-                                    if success:
-                                        output_files.append(output_file)
-                                        st.success(f"✅ Converted {file.name} to {output_format}")
-                                    
-                                except Exception as e:
-                                    st.error(f"❌ Error converting {file.name}: {str(e)}")
-                                    logger.error(f"Error during file conversion: {str(e)}")
-                                    logger.error(traceback.format_exc())
+                                    save_upload(file, filepath, ext)
+                                except UploadRejected as e:
+                                    logger.error(f"File type mismatch for {file.name}: {e}")
+                                    st.error(f"File type mismatch for {file.name}")
                                     continue
+                                
+                                output_file = results.output_path(key, f'{base_filename}{output_extension}')
+                                job = ConversionJob(file.name, filepath, ext, output_format, output_file,
+                                                    EXCEL_WRITE_ONLY_MIN_BYTES, excel_pdf_engine='html',
+                                                    sheet_per_table=sheet_per_table)
+                                keys[job] = key
+                                jobs.append(job)
+                            
+                            # Convert in parallel, updating the progress table as each file finishes
+                            progress = {results.get(key).name: {"File": results.get(key).name, "Status": "✅ Already converted", "Time (s)": None} for key in reused}
+                            progress.update({job.name: {"File": job.name, "Status": "⏳ Converting", "Time (s)": None} for job in jobs})
+                            if progress:
+                                # Only needed for the progress table, so plain reruns don't load pandas
+                                import pandas as pd
+                                progress_bar = st.progress(0.0)
+                                progress_table = st.empty()
+                                progress_table.dataframe(pd.DataFrame(progress.values()), hide_index=True, use_container_width=True)
+                                ready = st.container()
+                                started = time.perf_counter()
+                            
+                            # With several files, each output goes into the zip as soon as it is ready
+                            zip_key = result_key(repr(batch_signature).encode())
+                            zip_output = results.output_path(zip_key, 'converted_files.zip')
+                            zip_needed = len(reused) + len(jobs) > 1
+                            with ZipFile(zip_output, 'w', compression=compression, compresslevel=compresslevel) if zip_needed else nullcontext() as zipf:
+                                def add_output(key):
+                                    entry = results.get(key)
+                                    output_keys.append(key)
+                                    if zipf is not None:
+                                        zipf.write(entry.path, arcname=entry.name)
+                                    with ready:
+                                        if len(output_keys) == 1:
+                                            st.subheader("📄 Download Converted Files")
+                                        create_download_button(entry, key)
+                            
+                                for key in reused:
+                                    add_output(key)
+                            
+                                cache = get_conversion_cache()
+                                for done, result in enumerate(get_batch_converter().run(jobs, cache=cache), start=1):
+                                    name = result.job.name
+                                    progress[name]["Time (s)"] = round(time.perf_counter() - started, 1)
+                                    if result.error is None:
+                                        progress[name]["Status"] = "✅ Converted"
+                                        results.add(keys[result.job], result.output_file)
+                                        add_output(keys[result.job])
+                                    else:
+                                        progress[name]["Status"] = f"❌ {result.error}"
+                                        st.error(f"❌ Error converting {name}: {str(result.error)}")
+                                    progress_bar.progress(done / len(jobs), text=f"{done}/{len(jobs)} files done")
+                                    progress_table.dataframe(pd.DataFrame(progress.values()), hide_index=True, use_container_width=True)
+                                if progress:
+                                    progress_bar.progress(1.0, text=f"{len(progress)}/{len(progress)} files done")
+                            
+                            stats = cache.stats()
+                            st.caption(f"Result cache: {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
                             
                             # Create zip file if multiple files
-                            if len(output_files) > 1:
-                                zip_output = os.path.join(tempfile.gettempdir(), f'converted_{uuid.uuid4().hex}.zip')
-                                with ZipFile(zip_output, 'w') as zipf:
-                                    for i, file_path in enumerate(output_files):
-                                        arcname = f'{base_filenames[i]}{output_extension}'
-                                        zipf.write(file_path, arcname=arcname)
-                                
+                            if len(output_keys) > 1:
+                                results.add(zip_key, zip_output)
                                 # Provide download link for zip
                                 st.subheader("📦 Download Converted Files")
-                                create_download_button(zip_output, "converted_files.zip")
+                                create_download_button(results.get(zip_key), zip_key)
                                 
-                            elif len(output_files) == 1:
-                                # Provide download link for single file
-                                st.subheader("📄 Download Converted File")
-                                output_filename = f'{base_filenames[0]}{output_extension}'
-                                create_download_button(output_files[0], output_filename)
-                            
-                            else:
+                            elif not output_keys:
                                 st.warning("⚠️ No files were successfully converted")
+                            
+                            if len(output_keys) <= 1:
+                                results.discard(zip_key)
+                                zip_key = None
+                            st.session_state['last_batch'] = (batch_signature, output_keys, zip_key)
+                        finally:
+                            shutil.rmtree(tmpdirname, ignore_errors=True)
                                 
                     except Exception as e:
                         st.error(f"❌ Unexpected error: {str(e)}")
                         logger.error(f"Unexpected error: {str(e)}")
                         logger.error(traceback.format_exc())
+        
+        # On any other rerun, offer the last batch again straight from disk
+        elif st.session_state.get('last_batch', (None,))[0] == batch_signature:
+            _, output_keys, zip_key = st.session_state['last_batch']
+            entries = [(key, results.get(key)) for key in output_keys]
+            entries = [(key, entry) for key, entry in entries if entry is not None]
+            if entries:
+                st.subheader("📄 Download Converted Files")
+                for key, entry in entries:
+                    create_download_button(entry, key)
+            if zip_key is not None and results.get(zip_key) is not None:
+                st.subheader("📦 Download Converted Files")
+                create_download_button(results.get(zip_key), zip_key)
     else:
         st.info("👆 Please upload files above to get started!")
         
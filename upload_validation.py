@@ -0,0 +1,91 @@
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'html': 'text/html'
+}
+# Package part every OOXML document of that type has besides [Content_Types].xml
+OOXML_PARTS = {'docx': 'word/', 'xlsx': 'xl/'}
+# libmagic only recognises an OOXML type when [Content_Types].xml comes first in the archive;
+# otherwise it reports a plain zip, and the central directory check decides
+GENERIC_ZIP_TYPES = {'application/zip', 'application/octet-stream'}
+ZIP_SIGNATURE = b'PK\x03\x04'
+
+SNIFF_BYTES = 8 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def check_head(head, ext):
+    """Reject an upload from its first bytes; raises UploadRejected"""
+    expected = MIME_TYPES.get(ext)
+    if expected is None:
+        raise UploadRejected(f"Unsupported file type: {ext}")
+    if ext in OOXML_PARTS and not head.startswith(ZIP_SIGNATURE):
+        raise UploadRejected(f"Not a ZIP package, so not a valid .{ext} file")
+    try:
+        import magic
+        mime = magic.from_buffer(head, mime=True)
+    except Exception as e:
+        raise UploadRejected(f"Could not determine the file type: {e}")
+    logger.debug(f"Sniffed MIME type: {mime}, Expected MIME type: {expected}")
+    if mime != expected and not (ext in OOXML_PARTS and mime in GENERIC_ZIP_TYPES):
+        raise UploadRejected(f"Content looks like {mime}, not .{ext}")
+
+
+def check_package(path, ext):
+    """Check an OOXML file's central directory for the parts its type needs; raises UploadRejected.
+
+    Only the directory at the end of the archive is read, not the members themselves.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+    except zipfile.BadZipFile as e:
+        raise UploadRejected(f"Corrupt ZIP package: {e}")
+    if '[Content_Types].xml' not in names:
+        raise UploadRejected("ZIP package has no [Content_Types].xml")
+    if not any(name.startswith(OOXML_PARTS[ext]) for name in names):
+        raise UploadRejected(f"Package has no {OOXML_PARTS[ext]} parts, so it is not a .{ext} file")
+
+
+def save_upload(stream, path, ext, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copy an upload stream to path, validating its type on the way; returns the bytes written.
+
+    The first SNIFF_BYTES are checked before anything is written, so a mismatched
+    upload is rejected without writing it out; OOXML files also get their central
+    directory checked once complete. Raises UploadRejected and leaves no file behind.
+    """
+    head = b''
+    while len(head) < SNIFF_BYTES:
+        chunk = stream.read(SNIFF_BYTES - len(head))
+        if not chunk:
+            break
+        head += chunk
+    check_head(head, ext)
+
+    written = len(head)
+    try:
+        with open(path, 'wb') as f:
+            f.write(head)
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                written += len(chunk)
+        if ext in OOXML_PARTS:
+            check_package(path, ext)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return written
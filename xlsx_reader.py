@@ -0,0 +1,48 @@
+import logging
+from contextlib import contextmanager
+from openpyxl import Workbook, load_workbook
+
+logger = logging.getLogger(__name__)
+
+ROW_CHUNK_SIZE = 1000
+
+
+def iter_row_chunks(rows, chunk_size=ROW_CHUNK_SIZE):
+    """Group a row iterator into lists of at most chunk_size rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@contextmanager
+def open_workbook(input_file):
+    """Open an XLSX workbook read-only, so rows are streamed from the archive on demand"""
+    workbook = load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        yield workbook
+    finally:
+        workbook.close()
+
+
+def copy_workbook_values(input_file, output_file, chunk_size=ROW_CHUNK_SIZE):
+    """Copy the cell values of every sheet into a new workbook, streaming both sides.
+
+    The source is read-only and the target write-only, so memory stays flat
+    however many rows the sheets have.
+    """
+    output = Workbook(write_only=True)
+    rows_written = 0
+    with open_workbook(input_file) as workbook:
+        for worksheet in workbook.worksheets:
+            target = output.create_sheet(worksheet.title)
+            for chunk in iter_row_chunks(worksheet.iter_rows(values_only=True), chunk_size):
+                for row in chunk:
+                    target.append(row)
+                rows_written += len(chunk)
+    output.save(output_file)
+    logger.debug(f"Copied {rows_written} rows to {output_file}")
@@ -0,0 +1,264 @@
+import html
+import logging
+from collections import namedtuple
+from datetime import date, datetime, time
+from openpyxl.styles.colors import COLOR_INDEX
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import iterparse
+from xlsx_reader import ROW_CHUNK_SIZE, iter_row_chunks, open_workbook
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLUMN_WIDTH = 8.43  # Excel's default, in characters of the default font
+# A4 landscape at 96 dpi, with the 0.25in top margin the Excel COM export uses
+PAGE_WIDTH_PX = 1122.5
+PAGE_HEIGHT_PX = 793.7
+PAGE_TOP_MARGIN_PX = 24.0
+MAX_COLUMN = 16384
+
+BORDER_STYLES = {
+    'hair': '1px dotted', 'dotted': '1px dotted', 'dashDotDot': '1px dashed', 'dashDot': '1px dashed',
+    'dashed': '1px dashed', 'thin': '1px solid', 'mediumDashDotDot': '2px dashed', 'mediumDashDot': '2px dashed',
+    'mediumDashed': '2px dashed', 'slantDashDot': '2px dashed', 'medium': '2px solid', 'thick': '3px solid',
+    'double': '3px double',
+}
+VERTICAL_ALIGN = {'top': 'top', 'center': 'middle', 'bottom': 'bottom', 'justify': 'middle', 'distributed': 'middle'}
+
+_COL = f'{{{SHEET_MAIN_NS}}}col'
+_ROW = f'{{{SHEET_MAIN_NS}}}row'
+_CELL = f'{{{SHEET_MAIN_NS}}}c'
+_MERGE = f'{{{SHEET_MAIN_NS}}}mergeCell'
+_FORMAT = f'{{{SHEET_MAIN_NS}}}sheetFormatPr'
+_SHEET_DATA = f'{{{SHEET_MAIN_NS}}}sheetData'
+
+BASE_CSS = '''
+body { margin: 0; font-family: Calibri, Carlito, Arial, sans-serif; font-size: 11pt; }
+table.sheet { border-collapse: collapse; table-layout: fixed; }
+table.sheet td { padding: 0 2px; vertical-align: bottom; white-space: nowrap; overflow: hidden; }
+'''
+
+
+class SheetLayout(namedtuple('SheetLayout', ['column_widths', 'spans', 'covered', 'row_heights', 'style_ids'])):
+    """Geometry of one sheet: pixel width per column (0 when hidden), merges, custom row heights and the cell styles used"""
+    __slots__ = ()
+
+    @property
+    def width(self):
+        return sum(self.column_widths)
+
+
+def column_pixels(width):
+    """Excel column width in characters to CSS pixels, as Excel does for the default 7px-wide digit"""
+    return int(width * 7 + 5)
+
+
+def read_sheet_layout(worksheet):
+    """Collect column widths, merged ranges and row heights in one streaming pass over the sheet XML.
+
+    Read-only worksheets don't parse <cols> or <mergeCells>, and merges come after
+    the cell data, so they have to be known before the rows are rendered.
+    """
+    column_ranges = []
+    default_width = DEFAULT_COLUMN_WIDTH
+    spans = {}
+    covered = set()
+    row_heights = {}
+    style_ids = set()
+    max_column = worksheet.max_column or 0
+    scan_cells = not worksheet.max_column
+    sheet_data = None
+
+    # _get_source is the same archive member openpyxl's own read-only parser streams
+    source = worksheet._get_source()
+    try:
+        for event, element in iterparse(source, events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == _SHEET_DATA:
+                    sheet_data = element
+                continue
+            if tag == _CELL:
+                style_ids.add(int(element.get('s', 0)))
+                if scan_cells and element.get('r'):
+                    max_column = max(max_column, coordinate_to_tuple(element.get('r'))[1])
+            elif tag == _ROW:
+                if element.get('customHeight') in ('1', 'true') and element.get('ht'):
+                    row_heights[int(element.get('r'))] = float(element.get('ht'))
+                # Drop finished rows so the pass stays flat on very long sheets
+                sheet_data.clear()
+            elif tag == _COL:
+                hidden = element.get('hidden') in ('1', 'true')
+                width = 0.0 if hidden else float(element.get('width', default_width))
+                column_ranges.append((int(element.get('min')), int(element.get('max')), width))
+            elif tag == _FORMAT and element.get('defaultColWidth'):
+                default_width = float(element.get('defaultColWidth'))
+            elif tag == _MERGE:
+                min_col, min_row, max_col, max_row = range_boundaries(element.get('ref'))
+                spans[(min_row, min_col)] = (max_row - min_row + 1, max_col - min_col + 1)
+                covered.update((row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1))
+                covered.discard((min_row, min_col))
+                max_column = max(max_column, max_col)
+    finally:
+        source.close()
+
+    widths = [default_width] * min(max_column, MAX_COLUMN)
+    for low, high, width in column_ranges:
+        for col in range(low, min(high, len(widths)) + 1):
+            widths[col - 1] = width
+    return SheetLayout([column_pixels(width) if width else 0 for width in widths], spans, covered, row_heights,
+                       style_ids)
+
+
+def _css_color(color):
+    if color is None:
+        return None
+    if color.type == 'rgb' and isinstance(color.rgb, str) and len(color.rgb) == 8:
+        return '#' + color.rgb[2:]
+    if color.type == 'indexed' and color.indexed is not None and color.indexed < len(COLOR_INDEX):
+        return '#' + COLOR_INDEX[color.indexed][2:]
+    # Theme colours would need the workbook theme resolved; leave them at the default
+    return None
+
+
+def _cell_css(workbook, style_array):
+    font = workbook._fonts[style_array.fontId]
+    fill = workbook._fills[style_array.fillId]
+    border = workbook._borders[style_array.borderId]
+    alignment = workbook._alignments[style_array.alignmentId]
+
+    rules = []
+    if font.b:
+        rules.append('font-weight: bold')
+    if font.i:
+        rules.append('font-style: italic')
+    decorations = [name for name, on in (('underline', font.u), ('line-through', font.strike)) if on]
+    if decorations:
+        rules.append(f'text-decoration: {" ".join(decorations)}')
+    if font.sz:
+        rules.append(f'font-size: {float(font.sz):g}pt')
+    if font.name:
+        rules.append(f'font-family: "{font.name}", Calibri, Carlito, Arial, sans-serif')
+    font_color = _css_color(font.color)
+    if font_color:
+        rules.append(f'color: {font_color}')
+
+    if getattr(fill, 'fill_type', None) == 'solid':
+        fill_color = _css_color(fill.fgColor)
+        if fill_color:
+            rules.append(f'background-color: {fill_color}')
+
+    for side_name in ('left', 'right', 'top', 'bottom'):
+        side = getattr(border, side_name)
+        if side is not None and side.style in BORDER_STYLES:
+            rules.append(f'border-{side_name}: {BORDER_STYLES[side.style]} {_css_color(side.color) or "#000"}')
+
+    if alignment.horizontal in ('left', 'center', 'right', 'justify'):
+        rules.append(f'text-align: {alignment.horizontal}')
+    elif alignment.horizontal == 'centerContinuous':
+        rules.append('text-align: center')
+    if alignment.vertical in VERTICAL_ALIGN:
+        rules.append(f'vertical-align: {VERTICAL_ALIGN[alignment.vertical]}')
+    if alignment.wrap_text:
+        rules.append('white-space: pre-wrap')
+    return '; '.join(rules)
+
+
+def stylesheet(workbook):
+    """One CSS class per workbook cell style (.s<index>), matching ReadOnlyCell style ids"""
+    rules = []
+    for index, style_array in enumerate(workbook._cell_styles):
+        css = _cell_css(workbook, style_array)
+        if css:
+            rules.append(f'td.s{index} {{ {css} }}')
+    return '\n'.join(rules)
+
+
+def plain_style_ids(workbook):
+    """Indexes of the cell styles that render like the workbook's default style (number formats aside)"""
+    if not workbook._cell_styles:
+        return {0}
+    default = _cell_css(workbook, workbook._cell_styles[0])
+    return {index for index, style_array in enumerate(workbook._cell_styles)
+            if _cell_css(workbook, style_array) == default}
+
+
+def display_value(value):
+    """Roughly what Excel's General format shows for a cell value"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f'{value:.10g}'
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d') if value.time() == time() else value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def page_css(index, layout):
+    """Named page for one sheet: A4 landscape, scaled up to the sheet's width so it prints fit-to-width"""
+    scale = max(1.0, layout.width / PAGE_WIDTH_PX)
+    return (f'@page sheet{index} {{ size: {PAGE_WIDTH_PX * scale:.1f}px {PAGE_HEIGHT_PX * scale:.1f}px; '
+            f'margin: {PAGE_TOP_MARGIN_PX * scale:.1f}px 0 0 0; }}\n'
+            f'section.sheet{index} {{ page: sheet{index}; }}\n'
+            f'section.sheet{index} table {{ width: {layout.width}px; }}')
+
+
+def iter_sheet_rows_html(worksheet, layout, chunk_size=ROW_CHUNK_SIZE):
+    """Yield the sheet's <tr> elements as one HTML fragment per chunk_size rows, streamed from the read-only worksheet"""
+    max_column = len(layout.column_widths)
+    rows = enumerate(worksheet.iter_rows(max_col=max_column or None), start=1)
+    for chunk in iter_row_chunks(rows, chunk_size):
+        yield ''.join(_row_html(row_index, row, layout) for row_index, row in chunk)
+
+
+def _row_html(row_index, row, layout):
+    cells = []
+    for col_index, cell in enumerate(row, start=1):
+        if (row_index, col_index) in layout.covered or not layout.column_widths[col_index - 1]:
+            continue
+        attributes = ''
+        style_id = getattr(cell, '_style_id', 0)
+        if style_id:
+            attributes += f' class="s{style_id}"'
+        rowspan, colspan = layout.spans.get((row_index, col_index), (1, 1))
+        if rowspan > 1:
+            attributes += f' rowspan="{rowspan}"'
+        if colspan > 1:
+            # Hidden columns are not rendered, so they don't count towards the span
+            colspan = sum(1 for width in layout.column_widths[col_index - 1:col_index - 1 + colspan] if width)
+            attributes += f' colspan="{colspan}"'
+        cells.append(f'<td{attributes}>{html.escape(display_value(cell.value))}</td>')
+    height = layout.row_heights.get(row_index)
+    style = f' style="height: {height:g}pt"' if height else ''
+    return f'<tr{style}>{"".join(cells)}</tr>\n'
+
+
+def iter_workbook_html(input_file):
+    """Yield an HTML document rendering every visible sheet of an XLSX workbook, one sheet per page run.
+
+    The workbook is opened read-only, so rows are streamed from the archive rather
+    than loaded as a whole; each sheet's layout takes one extra streaming pass.
+    """
+    with open_workbook(input_file) as workbook:
+        sheets = [worksheet for worksheet in workbook.worksheets if worksheet.sheet_state == 'visible']
+        layouts = [read_sheet_layout(worksheet) for worksheet in sheets]
+
+        yield '<!DOCTYPE html><html><head><meta charset="utf-8"><style>'
+        yield BASE_CSS
+        yield stylesheet(workbook)
+        for index, layout in enumerate(layouts):
+            yield '\n' + page_css(index, layout)
+        yield '</style></head><body>\n'
+
+        for index, (worksheet, layout) in enumerate(zip(sheets, layouts)):
+            logger.debug(f"Rendering sheet {worksheet.title}: {len(layout.column_widths)} columns, {len(layout.spans)} merges")
+            yield f'<section class="sheet{index}"><table class="sheet"><colgroup>'
+            yield ''.join(f'<col style="width: {width}px">' for width in layout.column_widths if width)
+            yield '</colgroup>\n'
+            yield from iter_sheet_rows_html(worksheet, layout)
+            yield '</table></section>\n'
+        yield '</body></html>'
@@ -0,0 +1,57 @@
+import io
+import os
+from zipfile import ZIP64_LIMIT, ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+ZIP_CHUNK_SIZE = 256 * 1024
+# PDF and XLSX outputs are already compressed, so deflating them again mostly burns CPU
+DEFAULT_COMPRESSION_LEVEL = 0
+
+
+def compression_settings(level):
+    """Map a 0-9 compression level to ZipFile's (compression, compresslevel); 0 stores entries as-is"""
+    level = int(level)
+    if not 0 <= level <= 9:
+        raise ValueError(f"Compression level must be between 0 and 9, got {level}")
+    if level == 0:
+        return ZIP_STORED, None
+    return ZIP_DEFLATED, level
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable target that hands ZipFile's output back in chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def stream_zip(entries, level=DEFAULT_COMPRESSION_LEVEL, chunk_size=ZIP_CHUNK_SIZE):
+    """Yield a ZIP archive of (arcname, path) entries as bytes while it is being built.
+
+    entries may be a lazy iterable, e.g. one fed by conversions as they finish, so
+    the first bytes go out as soon as the first entry exists. Because the target is
+    unseekable, ZipFile writes sizes and CRCs in data descriptors after each entry,
+    and Zip64 headers have to be requested up front for entries that may need them.
+    """
+    compression, compresslevel = compression_settings(level)
+    sink = _ChunkSink()
+    with ZipFile(sink, 'w', compression=compression, compresslevel=compresslevel) as zipf:
+        for arcname, path in entries:
+            force_zip64 = os.path.getsize(path) * 1.05 > ZIP64_LIMIT
+            with open(path, 'rb') as src, zipf.open(arcname, 'w', force_zip64=force_zip64) as dest:
+                for chunk in iter(lambda: src.read(chunk_size), b''):
+                    dest.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+